@@ -0,0 +1,94 @@
+"""
+Pytest configuration for the throughput benchmarks.
+
+Every benchmark records a throughput (higher is better) under a unique name. The collected values are
+written to a JSON file, and compared against a stored baseline: a benchmark fails when its throughput
+falls more than the tolerance below the baseline value. Baselines are machine specific, so none is
+committed; without one the throughputs are only recorded, with a warning.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--bench-output", default=os.path.join(BENCHMARK_DIR, "results.json"),
+                    help="JSON file the benchmark results are written to")
+    group.addoption("--bench-baseline", default=os.path.join(BENCHMARK_DIR, "baseline.json"),
+                    help="JSON file with baseline throughputs (checks are skipped with a warning if it does "
+                         "not exist)")
+    group.addoption("--bench-tolerance", type=float, default=0.25,
+                    help="Allowed relative throughput drop against the baseline")
+    group.addoption("--bench-save-baseline", action="store_true",
+                    help="Store this run's results as the new baseline")
+
+
+class BenchmarkRecorder:
+    """Collects benchmark throughputs and checks them against the baseline (if there is one)."""
+
+    def __init__(self, baseline, tolerance):
+        self.baseline, self.tolerance = baseline, tolerance
+        self.results = {}
+
+    def record(self, name, throughput, unit, **details):
+        """Records a throughput (plus optional details) and fails if it regressed beyond the tolerance."""
+        self.results[name] = {"throughput": throughput, "unit": unit, **details}
+        if self.baseline is None:
+            return
+        if name not in self.baseline:
+            warnings.warn(f"{name} has no baseline throughput, so it is not checked. Refresh the baseline "
+                          f"with --bench-save-baseline.")
+            return
+        minimum = self.baseline[name]["throughput"] * (1 - self.tolerance)
+        assert throughput >= minimum, (f"{name}: {throughput:.4g} {unit} is below the baseline "
+                                       f"{self.baseline[name]['throughput']:.4g} {unit} "
+                                       f"(tolerance {self.tolerance:.0%})")
+
+
+def measure(function, min_time=0.2, max_repeats=50):
+    """Returns the best wall time of one call, repeating the call for at least min_time seconds."""
+    function()  # Warm-up
+    best, elapsed, repeats = float("inf"), 0.0, 0
+    while elapsed < min_time and repeats < max_repeats:
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        best, elapsed, repeats = min(best, duration), elapsed + duration, repeats + 1
+    return best
+
+
+@pytest.fixture(scope="session")
+def bench(request):
+    """Session-wide benchmark recorder, writing its results when the session ends."""
+    config = request.config
+    baseline_path = config.getoption("--bench-baseline")
+    baseline = None  # Nothing is checked while a new baseline is stored
+    if not config.getoption("--bench-save-baseline"):
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)["benchmarks"]
+        else:
+            warnings.warn(f"No benchmark baseline at {baseline_path}, so no throughput is checked against one. "
+                          f"Store this machine's baseline with --bench-save-baseline.")
+
+    recorder = BenchmarkRecorder(baseline, config.getoption("--bench-tolerance"))
+    yield recorder
+
+    report = {"machine": platform.machine(), "python": platform.python_version(),
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "benchmarks": recorder.results}
+    paths = [config.getoption("--bench-output")]
+    if config.getoption("--bench-save-baseline"):
+        paths.append(baseline_path)
+    for path in paths:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
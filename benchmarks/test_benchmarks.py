@@ -0,0 +1,75 @@
+"""
+Throughput benchmarks for the simulation, fidelity, experiment and optimization hot paths.
+
+Run in simulation mode only, so no LabOneQ hardware is needed:
+    python -m pytest benchmarks
+"""
+
+import numpy as np
+import pytest
+from conftest import measure
+from utility import (simulate_iq_response, simulate_iq_batch, simulate_multiplexed_batch, calculate_fidelities,
+                     calculate_qubit_fidelities, DISCRIMINATORS)
+from experiment import Experiment
+from optimization import basic_optimization
+
+SHOT_COUNTS = [200, 2000]
+BATCH_POINTS = 256
+
+
+@pytest.mark.parametrize("num_shots", SHOT_COUNTS)
+def test_simulate_iq_batch(bench, num_shots):
+    rng = np.random.default_rng(0)
+    amplitudes, frequencies = np.linspace(0.5, 2.0, BATCH_POINTS), np.full(BATCH_POINTS, 6.5)
+    duration = measure(lambda: simulate_iq_batch("0", amplitudes, frequencies, num_shots, rng=rng))
+    bench.record(f"simulate_iq_batch[{num_shots}]", BATCH_POINTS * num_shots / duration, "shots/s")
+
+
+def test_simulate_iq_response(bench):
+    rng = np.random.default_rng(0)
+    duration = measure(lambda: [simulate_iq_response("0", 1.0, 6.5, rng=rng) for _ in range(200)])
+    bench.record("simulate_iq_response", 200 / duration, "shots/s")
+
+
+@pytest.mark.parametrize("discriminator", list(DISCRIMINATORS))
+@pytest.mark.parametrize("num_shots", SHOT_COUNTS)
+def test_calculate_fidelities(bench, discriminator, num_shots):
+    rng = np.random.default_rng(0)
+    amplitudes, frequencies = np.linspace(0.5, 2.0, BATCH_POINTS), np.full(BATCH_POINTS, 6.5)
+    iq_data_0 = simulate_iq_batch("0", amplitudes, frequencies, num_shots, rng=rng)
+    iq_data_1 = simulate_iq_batch("1", amplitudes, frequencies, num_shots, rng=rng)
+    duration = measure(lambda: calculate_fidelities(iq_data_0, iq_data_1, discriminator))
+    bench.record(f"calculate_fidelities[{discriminator}-{num_shots}]", BATCH_POINTS / duration, "evaluations/s")
+
+
+@pytest.mark.parametrize("num_qubits", [2, 8])
+def test_multiplexed_readout(bench, num_qubits):
+    # Simulating and discriminating all qubits of a feedline together
+    rng = np.random.default_rng(0)
+    amplitudes = np.tile(np.linspace(0.5, 2.0, BATCH_POINTS)[:, None], (1, num_qubits))
+    frequencies = np.full((BATCH_POINTS, num_qubits), 6.5) + 0.1 * np.arange(num_qubits)
+
+    def readout():
+        iq_data_0 = simulate_multiplexed_batch("0", amplitudes, frequencies, 200, crosstalk=0.05, rng=rng)
+        iq_data_1 = simulate_multiplexed_batch("1", amplitudes, frequencies, 200, crosstalk=0.05, rng=rng)
+        return calculate_qubit_fidelities(iq_data_0, iq_data_1)
+
+    duration = measure(readout)
+    bench.record(f"multiplexed_readout[{num_qubits}]", BATCH_POINTS * num_qubits / duration, "qubit evaluations/s")
+
+
+@pytest.mark.parametrize("num_shots", SHOT_COUNTS)
+def test_experiment_run(bench, num_shots):
+    experiment = Experiment(seed=0)
+    duration = measure(lambda: experiment.run("Gaussian", 1.0, 6.5, num_shots=num_shots))
+    bench.record(f"experiment_run[{num_shots}]", 1 / duration, "runs/s")
+
+
+@pytest.mark.parametrize("num_shots", SHOT_COUNTS)
+@pytest.mark.parametrize("steps", [4, 8])
+def test_grid_search(bench, steps, num_shots):
+    # Points of the full grid: steps^2 for Gaussian and Square, steps^3 for DRAG
+    num_points = 2 * steps ** 2 + steps ** 3
+    duration = measure(lambda: basic_optimization(["Gaussian", "Square", "DRAG"], (0.6, 1.0), (6.4, 6.6), steps,
+                                                  seed=0, num_shots=num_shots))
+    bench.record(f"grid_search[{steps}-{num_shots}]", num_points / duration, "points/s", wall_time_s=duration)
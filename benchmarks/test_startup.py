@@ -0,0 +1,47 @@
+"""
+Startup-time budgets for main.py, checked in fresh interpreter processes.
+
+Simulation runs must not import LabOneQ or matplotlib, so they start quickly even without them installed.
+"""
+
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HELP_BUDGET = 1.5  # seconds for 'main.py --help'
+SIMULATION_BUDGET = 3.0  # seconds for a small simulated optimization
+HEAVY_MODULES = ["laboneq", "matplotlib"]
+
+SIMULATION_ARGS = ["--mode", "automatic", "--pulse", "Square", "--amplitude", "1.0", "--frequency", "6.5",
+                   "--opt_steps", "3", "--seed", "0"]
+
+
+def run_main(args, tmp_path):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, "main.py"), *args], cwd=tmp_path, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize("args, budget", [(["--help"], HELP_BUDGET), (SIMULATION_ARGS, SIMULATION_BUDGET)],
+                         ids=["help", "simulation"])
+def test_startup_budget(bench, tmp_path, args, budget):
+    duration = min(run_main(args, tmp_path) for _ in range(3))
+    bench.record(f"startup[{'help' if args == ['--help'] else 'simulation'}]", 1 / duration, "runs/s",
+                 wall_time_s=duration)
+    assert duration < budget, f"main.py {' '.join(args)} took {duration:.2f} s (budget {budget:.1f} s)"
+
+
+def test_simulation_skips_heavy_imports(tmp_path):
+    script = (
+        "import sys, runpy\n"
+        f"sys.argv = ['main.py', *{SIMULATION_ARGS!r}]\n"
+        f"runpy.run_path({os.path.join(REPO_DIR, 'main.py')!r}, run_name='__main__')\n"
+        f"print(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, check=True, capture_output=True,
+                            text=True, env={**os.environ, "PYTHONPATH": REPO_DIR}).stdout
+    assert output.strip().splitlines()[-1] == "[]"
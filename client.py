@@ -0,0 +1,69 @@
+"""
+This module is the command line client of the calibration daemon. It takes the same arguments as main.py.
+"""
+
+import os
+import sys
+from tqdm import tqdm
+from daemon import request
+from main import build_parser, parse_job
+from error_handling import handle_error
+from config import DAEMON_SOCKET_PATH
+
+
+def run_job(job, priority=0, socket_path=DAEMON_SOCKET_PATH):
+    """Sends a job to the calibration daemon and yields the messages it streams back until the job ends."""
+    yield from request({"command": "run", "job": job, "priority": priority}, socket_path)
+
+
+def print_result(result):
+    """Prints the parameters and fidelity of a result received from the daemon."""
+    qubit = f"Qubit {result['qubit']}: " if "qubit" in result else ""
+    parameters = "".join(f", {name.capitalize()}={result[name]:.3f}" for name in ("beta", "length")
+                         if result.get(name) is not None)
+    print(f"{qubit}{result['pulse_type']} pulse, Amplitude={result['amplitude']:.3f}, "
+          f"Frequency={result['frequency']:.3f}{parameters}, Fidelity={result['fidelity']:.3f}")
+
+
+if __name__ == "__main__":
+    parser = build_parser("Run a qubit readout experiment on the calibration daemon.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET_PATH,
+                        help="Path of the calibration daemon's Unix socket")
+    parser.add_argument("--priority", type=int, default=0,
+                        help="Queue priority of the job, higher priorities run first")
+    args, job = parse_job(parser)
+
+    if args.profile:
+        parser.error("--profile is not available for daemon jobs.")
+    if job["plot_output"] is not None:  # Plots are written by the daemon, which may run in another directory
+        job["plot_output"] = os.path.abspath(job["plot_output"])
+
+    succeeded, pbar = False, None
+    try:
+        for message in run_job(job, args.priority, args.socket):
+            if message["type"] == "queued":
+                print(f"Job {message['job']} queued")
+            elif message["type"] == "started":
+                print(f"Job {message['job']} started")
+            elif message["type"] == "progress":
+                if pbar is None:
+                    pbar = tqdm(total=message["total"], desc="Job Progress", file=sys.stdout)
+                pbar.update(message["done"] - pbar.n)
+                if pbar.n >= pbar.total:
+                    pbar.close()
+                    pbar = None
+            elif message["type"] == "log":
+                (pbar.write if pbar is not None else print)(message["message"])
+            elif message["type"] == "results" and args.mode == "manual":  # Best results are printed as logs
+                for result in message["results"]:
+                    print_result(result)
+            elif message["type"] == "error":
+                print(f"Error: {message['error']}")
+            succeeded = message["type"] == "done"
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        handle_error(f"Could not reach the calibration daemon on {args.socket}", e, exit_program=True)
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    sys.exit(0 if succeeded else 1)
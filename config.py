@@ -9,3 +9,23 @@ PULSE_SHAPES = ["Gaussian", "Square", "DRAG"]
 AMPLITUDE_SCALING = 0.2  # for automatic amplitude optimization
 FREQUENCY_SCALING = 0.05  # for automatic frequency optimization
 RESULTS_DIR = "results"
+SIMULATION_BATCH_SIZE = 512  # parameter points simulated per vectorized batch
+DEFAULT_DISCRIMINATOR = "nearest_mean"  # state discriminator used for fidelity calculation
+COMPILED_CACHE_SIZE = 16  # compiled LabOneQ experiments kept in memory for hardware runs
+BETA_RANGE = (0.1, 1.0)  # DRAG beta range for automatic optimization
+OPTIMIZER_MAX_EVALUATIONS = 40  # experiment runs per pulse shape for the adaptive optimizers
+NOISE_LEVEL = 0.5  # IQ noise standard deviation in simulation mode
+CACHE_PATH = "cache/evaluations.sqlite"  # persistent evaluation cache
+CACHE_MAX_ENTRIES = 200000  # evaluations kept in the cache before the least recently used are evicted
+DENSITY_SHOT_THRESHOLD = 1000  # shots per state above which IQ plots show density instead of single shots
+PIPELINE_QUEUE_SIZE = 2  # jobs buffered between pipeline stages
+SEQUENTIAL_BATCH_SHOTS = 25  # shots per state acquired per step in adaptive shot allocation
+SEQUENTIAL_CONFIDENCE = 0.95  # confidence level of the fidelity intervals in adaptive shot allocation
+SEQUENTIAL_PRECISION = 0.02  # fidelity interval half-width at which a point stops acquiring shots
+CROSSTALK = 0.05  # fraction of each qubit's readout signal leaking into the others in multiplexed simulation
+READOUT_LENGTH = 1e-6  # readout pulse length in seconds
+READOUT_LO_STEP = 200e6  # frequency grid (Hz) of the readout local oscillator
+READOUT_MAX_IF = 500e6  # largest readout intermediate frequency (Hz), above or below the local oscillator
+SWEEP_POINTS = 4  # points per swept parameter in manual range mode
+DAEMON_SOCKET_PATH = "calibration.sock"  # local Unix socket of the calibration daemon
+DAEMON_CONCURRENCY = 1  # calibration daemon jobs run at the same time
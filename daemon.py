@@ -0,0 +1,280 @@
+"""
+This module runs a long-lived calibration server, which keeps warm experiments and runs jobs sent to it
+as JSON over a local Unix socket.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import numpy as np
+from error_handling import handle_error
+from config import DAEMON_SOCKET_PATH, DAEMON_CONCURRENCY
+
+_SHUTDOWN = float("-inf")  # Queue priority of the worker stop markers, ahead of every job
+
+
+def send_message(stream, message):
+    """Writes a message to a socket stream as one line of JSON."""
+    stream.write(json.dumps(message, default=_to_json).encode() + b"\n")
+    stream.flush()
+
+
+def _to_json(value):
+    """Converts the numpy values found in results into plain JSON values."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def request(message, socket_path=DAEMON_SOCKET_PATH):
+    """Sends a request to the calibration daemon and yields the messages it streams back."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile("rwb") as stream:
+            send_message(stream, message)
+            for line in stream:
+                yield json.loads(line)
+
+
+def _wire_result(result):
+    """Converts a result for sending, leaving out the IQ shots (they are saved on the server if requested)."""
+    result = result.to_dict() if hasattr(result, "to_dict") else dict(result)
+    return {key: value for key, value in result.items() if key not in ("iq_data_0", "iq_data_1")}
+
+
+class _JobOutput:
+    """
+    Stands in for sys.stdout, so that what a job prints (results, saved paths and errors) is sent to its
+    client as log messages, while everything else still goes to the server console.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()  # Each worker thread prints for its own job
+
+    def attach(self, emit):
+        self._local.emit, self._local.buffer = emit, ""
+
+    def detach(self):
+        if self._local.buffer:
+            self._local.emit({"type": "log", "message": self._local.buffer})
+        self._local.emit = None
+
+    def write(self, text):
+        emit = getattr(self._local, "emit", None)
+        if emit is None:
+            return self.stream.write(text)
+        *lines, self._local.buffer = (self._local.buffer + text).split("\n")
+        for line in lines:
+            emit({"type": "log", "message": line})
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection: a status or shutdown request, or a job whose messages are streamed back."""
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+        except ValueError as e:
+            return send_message(self.wfile, {"type": "error", "error": f"Invalid request: {e}"})
+        if not isinstance(message, dict):
+            return send_message(self.wfile, {"type": "error", "error": "Invalid request: expected a JSON object"})
+
+        command = message.get("command", "run")
+        if command == "status":
+            send_message(self.wfile, self.server.status())
+        elif command == "shutdown":
+            send_message(self.wfile, {"type": "shutdown"})
+            threading.Thread(target=self.server.shutdown).start()
+        elif command == "run":
+            job, priority = message.get("job", {}), message.get("priority", 0)
+            if not isinstance(job, dict) or not isinstance(priority, int) or isinstance(priority, bool):
+                return send_message(self.wfile, {"type": "error", "error": "Invalid request: the job must be an "
+                                                                           "object and the priority an integer"})
+            messages = queue.Queue()
+            job_id = self.server.submit(job, priority, messages.put)
+            try:
+                send_message(self.wfile, {"type": "queued", "job": job_id})
+                while True:
+                    reply = messages.get()
+                    send_message(self.wfile, reply)
+                    if reply["type"] in ("done", "error"):
+                        break
+            except OSError:  # The client went away, its job is dropped if it has not started yet
+                self.server.cancel(job_id)
+        else:
+            send_message(self.wfile, {"type": "error", "error": f"Unknown command '{command}'"})
+
+
+class CalibrationServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Runs experiment jobs on a pool of worker threads, each keeping its own warm Experiment per number of qubits.
+
+    Jobs are the keyword arguments of main.run_experiment, sent as JSON by the client, and run by priority
+    (highest first, then in order of arrival). Every Experiment is created once, so LabOneQ is imported,
+    the pulses are built, experiments are compiled and the device is connected only for the first job that
+    needs them. Progress, printed output and results of a job are streamed back to its client.
+    A device session runs one job at a time, so on hardware the concurrency must be 1.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=DAEMON_SOCKET_PATH, concurrency=DAEMON_CONCURRENCY, device_id=None):
+        if concurrency <= 0:
+            raise ValueError("The daemon concurrency must be a positive integer.")
+        if device_id and concurrency > 1:
+            raise ValueError("Jobs on a hardware device must run one at a time (concurrency 1).")
+
+        _remove_stale_socket(socket_path)
+        super().__init__(socket_path, _JobHandler)
+        self.socket_path, self.concurrency, self.device_id = socket_path, concurrency, device_id
+        self._jobs = queue.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._running, self._cancelled = {}, set()
+        self._output = _JobOutput(sys.stdout)
+        self._workers = [threading.Thread(target=self._work, name=f"calibration-worker-{index}", daemon=True)
+                         for index in range(concurrency)]
+
+    def submit(self, job, priority, emit):
+        """Queues a job and returns its id. emit(message) is called with every message of the job."""
+        job_id = next(self._ids)
+        self._jobs.put((-priority, job_id, job, emit))
+        return job_id
+
+    def cancel(self, job_id):
+        """Drops a job that has not started yet."""
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def status(self):
+        """Describes the queued and running jobs."""
+        with self._lock:
+            running = dict(self._running)
+        return {"type": "status", "queued": self._jobs.qsize(), "running": running,
+                "concurrency": self.concurrency, "device_id": self.device_id}
+
+    def serve(self):
+        """Serves requests until a shutdown request arrives, then stops the workers and removes the socket."""
+        sys.stdout = self._output
+        for worker in self._workers:
+            worker.start()
+        try:
+            self.serve_forever()
+        finally:
+            for _ in self._workers:  # Workers finish their current job, queued jobs are dropped
+                self._jobs.put((_SHUTDOWN, 0, None, None))
+            for worker in self._workers:
+                worker.join()
+            while not self._jobs.empty():
+                _, job_id, job, emit = self._jobs.get()
+                if job is not None:
+                    emit({"type": "error", "job": job_id, "error": "The calibration daemon shut down."})
+            sys.stdout = self._output.stream
+            self.server_close()
+            os.remove(self.socket_path)
+
+    def _work(self):
+        """Runs queued jobs until a stop marker arrives."""
+        experiments = {}  # Warm experiments of this worker, by number of qubits
+        try:
+            while True:
+                _, job_id, job, emit = self._jobs.get()
+                if job is None:
+                    return
+                try:
+                    with self._lock:
+                        if job_id in self._cancelled:
+                            self._cancelled.discard(job_id)
+                            continue
+                        self._running[job_id] = job.get("mode")
+                    self._run(job_id, job, emit, experiments)
+                except Exception as e:  # A bad job fails on its own, the worker keeps serving
+                    emit({"type": "error", "job": job_id, "error": f"Job {job_id} failed: {e}"})
+                finally:
+                    with self._lock:
+                        self._running.pop(job_id, None)
+        finally:
+            for experiment in experiments.values():
+                experiment.close()
+
+    def _run(self, job_id, job, emit, experiments):
+        """Runs one job on the worker's experiments, streaming its messages."""
+        from experiment import Experiment
+        from main import run_experiment
+
+        emit({"type": "started", "job": job_id})
+        done = 0
+
+        def progress(count, total):
+            nonlocal done
+            done += count
+            emit({"type": "progress", "job": job_id, "done": done, "total": total})
+
+        self._output.attach(emit)
+        try:
+            num_qubits = job.get("num_qubits", 1)
+            if num_qubits not in experiments:
+                experiments[num_qubits] = Experiment(device_id=self.device_id, num_qubits=num_qubits)
+            run_experiment(**dict(job, show_plot=False), experiment=experiments[num_qubits], progress=progress,
+                           on_results=lambda results: emit({"type": "results", "job": job_id,
+                                                            "results": [_wire_result(result) for result in results]}))
+        except (Exception, SystemExit) as e:  # run_experiment exits after printing its errors to the client
+            self._output.detach()
+            emit({"type": "error", "job": job_id, "error": f"Job {job_id} failed" if isinstance(e, SystemExit)
+                  else f"Job {job_id} failed: {e}"})
+        else:
+            self._output.detach()
+            emit({"type": "done", "job": job_id})
+
+
+def _remove_stale_socket(socket_path):
+    """Removes the socket file of a daemon that is no longer running, refusing to replace a running one."""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"A calibration daemon is already running on {socket_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the calibration daemon, or query or stop a running one.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET_PATH,
+                        help="Path of the daemon's Unix socket")
+    parser.add_argument("--concurrency", type=int, default=DAEMON_CONCURRENCY,
+                        help="Number of jobs run at the same time (simulation mode only)")
+    parser.add_argument("--device_id", default=None,
+                        help="Run the jobs on this hardware device instead of simulating them")
+    parser.add_argument("--status", action="store_true",
+                        help="Print the queued and running jobs of the running daemon")
+    parser.add_argument("--shutdown", action="store_true",
+                        help="Stop the running daemon once its current jobs are done")
+    args = parser.parse_args()
+
+    try:
+        if args.status or args.shutdown:
+            for reply in request({"command": "status" if args.status else "shutdown"}, args.socket):
+                print(json.dumps(reply))
+        else:
+            server = CalibrationServer(args.socket, args.concurrency, args.device_id)
+            print(f"Calibration daemon listening on {args.socket} ({args.concurrency} concurrent jobs)")
+            server.serve()
+    except Exception as e:
+        handle_error("Calibration daemon failed", e, exit_program=True)
@@ -4,48 +4,239 @@ This module handles data saving and validation.
 
 import json
 import csv
+import itertools
 import os
 from datetime import datetime
 import argparse
+import textwrap
+import numpy as np
 from error_handling import handle_error
 from config import RESULTS_DIR
+from results import ReadoutResult
+from profiling import stage
 
-# Ensuring the results directory exists, otherwise create it
-os.makedirs(RESULTS_DIR, exist_ok=True)
+
+def results_path(save_format):
+    """
+    Returns a new timestamped path for saving results in the given format, creating the results directory.
+
+    The file is created empty to reserve it, with a numbered suffix if the path is taken, so runs saving
+    at the same time (e.g. daemon jobs) never write to the same file.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    for attempt in itertools.count(1):
+        suffix = f"_{attempt}" if attempt > 1 else ""
+        path = f"{RESULTS_DIR}/experiment_results_{timestamp}{suffix}.{save_format}"
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            return path
+        except FileExistsError:
+            continue
+
+
+class ResultsStore:
+    """
+    Appendable binary store of experiment results.
+
+    IQ shots are appended as raw float32 values to a '.bin' file, and every result adds a row to a
+    '.index.csv' parameter table holding its parameters, fidelity and the location of its shots.
+    Stored results are read back through a memory map, so a single point is loaded without reading
+    the whole file.
+    """
+
+    INDEX_FIELDS = ["pulse_type", "amplitude", "frequency", "beta", "fidelity", "offset", "shots_0", "shots_1"]
+
+    def __init__(self, path, mode="r"):
+        """Open the store at path (with or without the '.bin' suffix) for reading ('r') or appending ('a')."""
+        self.path = path[:-len(".bin")] if path.endswith(".bin") else path
+        self.data_path, self.index_path = f"{self.path}.bin", f"{self.path}.index.csv"
+        self.mode = mode
+        self._data_file = self._index_file = self._writer = self._memmap = None
+        self.index = self._read_index()
+
+        if mode == "a":
+            new_index = not os.path.exists(self.index_path)
+            self._data_file = open(self.data_path, "ab")
+            # Drop the shots of an interrupted append (written without their index row), so that new
+            # entries are written where their offsets point
+            self._data_file.truncate(self._end_of_data() * np.dtype(np.float32).itemsize)
+            self._index_file = open(self.index_path, "a", newline="")
+            self._writer = csv.DictWriter(self._index_file, fieldnames=self.INDEX_FIELDS)
+            if new_index:
+                self._writer.writeheader()
+                self._index_file.flush()
+        elif mode != "r":
+            raise ValueError(f"Unsupported results store mode: {mode}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, point):
+        """Returns the result of one point, with its IQ data as read-only float32 views of the file."""
+        if self._memmap is None or self._memmap.size < self._end_of_data():
+            self._memmap = np.memmap(self.data_path, dtype=np.float32, mode="r")
+        entry = self.index[point]
+        offset, shots_0, shots_1 = entry["offset"], entry["shots_0"], entry["shots_1"]
+        return {
+            **{key: entry[key] for key in ["pulse_type", "amplitude", "frequency", "beta", "fidelity"]},
+            "iq_data_0": self._memmap[offset:offset + 2 * shots_0].reshape(shots_0, 2),
+            "iq_data_1": self._memmap[offset + 2 * shots_0:offset + 2 * (shots_0 + shots_1)].reshape(shots_1, 2),
+        }
+
+    def __iter__(self):
+        return (self[point] for point in range(len(self)))
+
+    def _end_of_data(self):
+        """Returns the number of float32 values referenced by the index."""
+        if not self.index:
+            return 0
+        last = self.index[-1]
+        return last["offset"] + 2 * (last["shots_0"] + last["shots_1"])
+
+    def _read_index(self):
+        """Reads the parameter index table."""
+        if not os.path.exists(self.index_path):
+            if self.mode == "r":
+                raise FileNotFoundError(f"Results index not found: {self.index_path}")
+            return []
+
+        with open(self.index_path, newline="") as f:
+            return [{
+                "pulse_type": row["pulse_type"], "amplitude": float(row["amplitude"]),
+                "frequency": float(row["frequency"]), "beta": float(row["beta"]) if row["beta"] else None,
+                "fidelity": float(row["fidelity"]), "offset": int(row["offset"]),
+                "shots_0": int(row["shots_0"]), "shots_1": int(row["shots_1"]),
+            } for row in csv.DictReader(f)]
+
+    def append(self, result):
+        """Appends a single experiment result, flushing it to disk so partial sweeps remain readable."""
+        if self._writer is None:
+            raise ValueError("Results store is not open for appending.")
+
+        iq_data = [np.asarray(result[key], dtype=np.float32).reshape(-1, 2) for key in ["iq_data_0", "iq_data_1"]]
+        entry = {
+            "pulse_type": result["pulse_type"], "amplitude": float(result["amplitude"]),
+            "frequency": float(result["frequency"]), "beta": result.get("beta"),
+            "fidelity": float(result["fidelity"]), "offset": self._end_of_data(),
+            "shots_0": len(iq_data[0]), "shots_1": len(iq_data[1]),
+        }
+        for data in iq_data:
+            self._data_file.write(data.tobytes())
+        self._data_file.flush()
+
+        self._writer.writerow({**entry, "beta": "" if entry["beta"] is None else entry["beta"]})
+        self._index_file.flush()
+        self.index.append(entry)
+
+    def extend(self, results):
+        """Appends several experiment results."""
+        for result in results:
+            self.append(result)
+
+    def close(self):
+        """Closes the underlying files."""
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = self._writer = self._memmap = None
+
+
+def load_results(path):
+    """Opens a binary results store for memory-mapped reading."""
+    return ResultsStore(path, mode="r")
 
 
 def save_results(results, save_format):
     """Saves experiment results in the specified format."""
-    try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        results_filename = f"{RESULTS_DIR}/experiment_results_{timestamp}.{save_format}"
+    with stage("save_results"):
+        _save_results(results, save_format)
 
-        csv_fields = ["pulse_type", "amplitude", "frequency", "fidelity"]
 
+def _save_results(results, save_format):
+    """Writes experiment results in the specified format."""
+    results_filename = None
+    try:
         # Ensure results is a list (even if a single dictionary is returned)
         if isinstance(results, dict):
             results = [results]
 
-        if save_format == "json":  # Save the data in json format
-            with open(results_filename, "w") as f:
-                json.dump(results, f, indent=2)
-            print(f"Results saved to {results_filename}")
-        elif save_format == "csv":  # Save the data in csv format
-            with open(results_filename, "w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=csv_fields)
-                writer.writeheader()
+        with ResultsWriter(save_format) as writer:
+            results_filename = writer.path
+            writer.write(results)
+        print(f"Results saved to {results_filename}")
 
-                for result in results:
-                    filtered_result = {key: result[key] for key in csv_fields if key in result}
-                    writer.writerow(filtered_result)
+    except Exception as e:
+        handle_error(f"Failed to save results to {results_filename}", e)
 
-            print(f"Results saved to {results_filename}")
 
-        else:
+class ResultsWriter:
+    """
+    Writes experiment results to a new results file as they arrive, in any of the save formats.
+
+    JSON results are written element by element into one array, CSV rows and BIN records are flushed
+    with every write, so a long sweep keeps no results in memory and leaves a readable file behind.
+    CSV files hold the pulse type, amplitude, frequency and fidelity, plus any extra_fields.
+    """
+
+    CSV_FIELDS = ["pulse_type", "amplitude", "frequency", "fidelity"]
+
+    def __init__(self, save_format, extra_fields=()):
+        if save_format not in ("json", "csv", "bin"):
             raise ValueError(f"Unsupported save format: {save_format}")
+        self.save_format, self.path = save_format, results_path(save_format)
+        self._written = 0
+        if save_format == "bin":
+            self._file, self._store = None, ResultsStore(self.path, mode="a")
+        else:
+            self._file, self._store = open(self.path, "w", newline=""), None
+        if save_format == "json":
+            self._file.write("[")
+        elif save_format == "csv":
+            self._csv_fields = self.CSV_FIELDS + [field for field in extra_fields if field not in self.CSV_FIELDS]
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=self._csv_fields)
+            self._csv_writer.writeheader()
 
-    except Exception as e:
-        handle_error(f"Failed to save results to {results_filename}", e)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, results):
+        """Appends results (skipping failed runs, and results without shots in BIN format)."""
+        for result in results:
+            if result is None:
+                continue
+            if self.save_format == "json":  # Laid out like json.dump(results, indent=2)
+                if isinstance(result, ReadoutResult):
+                    result = result.to_dict()
+                text = textwrap.indent(json.dumps(result, indent=2), "  ")
+                self._file.write(f"{',' if self._written else ''}\n{text}")
+            elif self.save_format == "csv":
+                self._csv_writer.writerow({key: result[key] for key in self._csv_fields if key in result})
+            elif "iq_data_0" in result:
+                self._store.append(result)
+            self._written += 1
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Completes and closes the results file."""
+        if self._file is not None:
+            if self.save_format == "json":
+                self._file.write("\n]" if self._written else "]")
+            self._file.close()
+            self._file = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
 
 
 def validate_value(value, min_val=None, max_val=None):
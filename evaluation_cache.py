@@ -0,0 +1,124 @@
+"""
+This module provides a persistent, content-addressed cache of experiment evaluations.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+from config import CACHE_PATH, CACHE_MAX_ENTRIES
+from results import ReadoutResult
+
+
+class EvaluationCache:
+    """
+    On-disk cache of evaluated parameter points, shared across runs.
+
+    Entries are addressed by a hash of everything that determines an evaluation (pulse type, amplitude,
+    frequency, beta, shot count, noise level, seed, backend, discriminator and readout length) and hold the
+    fidelity and IQ statistics.
+    Every entry is committed as soon as it is stored, so an interrupted run resumes from the cache.
+    Once more than max_entries are stored, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path, self.max_entries = path, max_entries
+        self.hits = self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS evaluations "
+                                 "(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    @staticmethod
+    def key(pulse_type, amplitude, frequency, beta, num_shots, noise_level, seed, backend, discriminator,
+            readout_length):
+        """Returns the content address of an evaluation. The seed is an int, a SeedSequence or None."""
+        if isinstance(seed, np.random.SeedSequence):  # e.g. the spawned stream of a sweep group
+            seed = [[int(value) for value in np.ravel(seed.entropy)], [int(value) for value in seed.spawn_key]]
+        elif seed is not None:
+            seed = int(seed)
+        description = json.dumps([pulse_type, float(amplitude), float(frequency),
+                                  None if beta is None else float(beta), int(num_shots), float(noise_level),
+                                  seed, str(backend), str(discriminator), float(readout_length)])
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def get_many(self, keys):
+        """Returns the cached evaluation (or None if it is not cached) of every key, in one transaction."""
+        values = []
+        for key in keys:
+            row = self._connection.execute("SELECT value FROM evaluations WHERE key = ?", (key,)).fetchone()
+            values.append(None if row is None else json.loads(row[0]))
+
+        hit_keys = [(key,) for key, value in zip(keys, values) if value is not None]
+        self.hits += len(hit_keys)
+        self.misses += len(keys) - len(hit_keys)
+        if hit_keys:
+            now = time.time()
+            self._connection.executemany("UPDATE evaluations SET last_access = ? WHERE key = ?",
+                                         [(now, key) for key, in hit_keys])
+            self._connection.commit()
+        return values
+
+    def get(self, key):
+        """Returns the cached evaluation for key, or None if it is not cached."""
+        return self.get_many([key])[0]
+
+    def put_many(self, entries):
+        """Stores (key, evaluation) pairs in one transaction, then evicts entries beyond the size bound."""
+        now = time.time()
+        self._connection.executemany("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?)",
+                                     [(key, json.dumps(value), now) for key, value in entries])
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._connection.execute("DELETE FROM evaluations WHERE key IN "
+                                     "(SELECT key FROM evaluations ORDER BY last_access LIMIT ?)", (excess,))
+        self._connection.commit()
+
+    def put(self, key, value):
+        """Stores a single evaluation."""
+        self.put_many([(key, value)])
+
+    def summary(self):
+        """Returns a one-line report of the cache hits and misses."""
+        return f"Evaluation cache: {self.hits} hits, {self.misses} misses ({len(self)} entries stored)"
+
+    def close(self):
+        """Closes the cache database."""
+        self._connection.close()
+
+
+def evaluation_key(experiment, point, num_shots, seed):
+    """
+    Returns the cache key of a (pulse_type, amplitude, frequency, beta) point run on the given experiment.
+
+    The readout length is keyed explicitly: the simulated noise level depends on it, but on hardware it is
+    the only place it shows up.
+    """
+    return EvaluationCache.key(*point, num_shots, experiment.simulated_noise_level, seed, experiment.backend,
+                               experiment.discriminator, experiment.readout_length)
+
+
+def cached_result(point, evaluation):
+    """Builds a summary-only result from a cached evaluation."""
+    pulse_type, amplitude, frequency, beta = point
+    statistics = {key: value for key, value in evaluation.items() if key != "fidelity"}
+    return ReadoutResult(pulse_type, amplitude, frequency, evaluation["fidelity"], beta=beta, statistics=statistics,
+                         cached=True)
+
+
+def cache_entry(result):
+    """Extracts the cached evaluation (fidelity and IQ statistics) from a result."""
+    return {"fidelity": result["fidelity"], **result.statistics()}
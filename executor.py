@@ -0,0 +1,138 @@
+"""
+This module handles evaluating many experiment parameter points, serially or on a process pool.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import chain, islice
+import numpy as np
+from config import NUM_MEASUREMENTS, SIMULATION_BATCH_SIZE
+from evaluation_cache import evaluation_key, cached_result, cache_entry
+
+_worker_experiment = None  # Experiment instance owned by each pool worker process
+
+
+def _init_worker(discriminator, noise_level, summary_only, readout_length):
+    """Create the simulation experiment of a pool worker process."""
+    global _worker_experiment
+    from experiment import Experiment
+    _worker_experiment = Experiment(discriminator=discriminator, noise_level=noise_level, summary_only=summary_only,
+                                    readout_length=readout_length)
+
+
+def _run_chunk(points, seed_sequence, num_shots):
+    """Evaluate one chunk of points in a pool worker, using the chunk's own random stream."""
+    return _worker_experiment.run_batch(points, num_shots, rng=np.random.default_rng(seed_sequence))
+
+
+def _chunks(points, chunk_size):
+    """Lazily split an iterable of points into lists of at most chunk_size points."""
+    points = iter(points)
+    return iter(lambda: list(islice(points, chunk_size)), [])
+
+
+def evaluate_points(experiment, points, workers=1, seed=None, num_shots=NUM_MEASUREMENTS, progress=None,
+                    chunk_size=SIMULATION_BATCH_SIZE, cache=None):
+    """
+    Evaluate (pulse_type, amplitude, frequency, beta) points and yield their results in the same order.
+
+    The points are consumed lazily in fixed-size chunks, each simulated with its own random stream spawned
+    from the seed (an int, or a SeedSequence), so the results do not depend on the number of workers. With
+    more than one worker the chunks are shared across a process pool, with at most two chunks per worker in
+    flight so memory stays bounded however many points there are; hardware experiments run on the given
+    experiment through its compile/execute/analyze pipeline.
+    Points found in the optional EvaluationCache are not run again, and new evaluations are stored in it
+    chunk by chunk. The optional progress callback receives the number of points of every completed chunk.
+    """
+    seed_root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+    def prepare(chunk):
+        """Look up a chunk in the cache, returning (chunk, keys, cached values, points to run, seed sequence)."""
+        if cache is not None:
+            keys = [evaluation_key(experiment, point, num_shots, seed) for point in chunk]
+            cached = cache.get_many(keys)
+        else:
+            keys, cached = None, [None] * len(chunk)
+        missing = [point for point, value in zip(chunk, cached) if value is None]
+        # Spawned one at a time, the chunks get the same streams as spawning them all at once
+        return chunk, keys, cached, missing, seed_root.spawn(1)[0]
+
+    def merge(prepared, fresh_results):
+        """Combine the cached and freshly evaluated results of a chunk, storing the fresh ones in the cache."""
+        chunk, keys, cached, _, _ = prepared
+        fresh_results, results, new_entries = iter(fresh_results), [], []
+        for position, (point, value) in enumerate(zip(chunk, cached)):
+            if value is not None:
+                results.append(cached_result(point, value))
+                continue
+            result = next(fresh_results)
+            results.append(result)
+            if cache is not None and result is not None:
+                new_entries.append((keys[position], cache_entry(result)))
+        if new_entries:
+            cache.put_many(new_entries)
+        return results
+
+    chunks = map(prepare, _chunks(points, chunk_size))
+
+    if experiment.use_hardware:  # Stream every missing point through the pipeline, one sweep job per chunk
+        chunks = list(chunks)
+        fresh_results = experiment.run_pipelined([point for *_, missing, _ in chunks for point in missing],
+                                                 num_shots, job_size=chunk_size)
+        for prepared in chunks:
+            results = merge(prepared, fresh_results)
+            if progress:
+                progress(len(prepared[0]))
+            yield from results
+        return
+
+    head = list(islice(chunks, 2))  # A single chunk is not worth starting a pool
+    chunks = chain(head, chunks)
+    if workers <= 1 or len(head) <= 1:
+        for prepared in chunks:
+            missing, seed_sequence = prepared[3], prepared[4]
+            fresh_results = (experiment.run_batch(missing, num_shots, rng=np.random.default_rng(seed_sequence))
+                             if missing else [])
+            results = merge(prepared, fresh_results)
+            if progress:
+                progress(len(prepared[0]))
+            yield from results
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(experiment.discriminator, experiment.noise_level, experiment.summary_only,
+                                       experiment.readout_length)) as pool:
+        in_flight, pending = deque(), set()
+
+        def submit():
+            """Submit the next chunk to the pool (fully cached chunks complete right away)."""
+            prepared = next(chunks, None)
+            if prepared is None:
+                return
+            chunk, _, _, missing, seed_sequence = prepared
+            future = pool.submit(_run_chunk, missing, seed_sequence, num_shots) if missing else None
+            if future is not None:
+                pending.add(future)
+            elif progress:
+                progress(len(chunk))
+            in_flight.append((prepared, future))
+
+        for _ in range(2 * workers):
+            submit()
+
+        # Report progress as chunks complete, but yield results strictly in point order
+        while in_flight:
+            prepared, future = in_flight[0]
+            if future is not None and not future.done():
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if progress:
+                    progress(sum(len(chunk) for (chunk, *_), finished in in_flight if finished in done))
+                continue
+            if future in pending:  # Completed while earlier chunks were being yielded
+                pending.discard(future)
+                if progress:
+                    progress(len(prepared[0]))
+            in_flight.popleft()
+            results = merge(prepared, future.result() if future is not None else [])
+            submit()
+            yield from results
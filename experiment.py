@@ -2,94 +2,520 @@
 This module handles the LabOneQ experiment, actual or simulated.
 """
 
+from collections import namedtuple
 import numpy as np
-from laboneq.simple import Experiment as LabOneQExperiment, pulse_library, Session
 from data_handler import validate_value
-from config import NUM_MEASUREMENTS, DEFAULT_AMPLITUDE_RANGE
-from utility import simulate_iq_response, calculate_fidelity
+from config import (NUM_MEASUREMENTS, DEFAULT_AMPLITUDE_RANGE, DEFAULT_DISCRIMINATOR, COMPILED_CACHE_SIZE,
+                    NOISE_LEVEL, PIPELINE_QUEUE_SIZE, SEQUENTIAL_BATCH_SHOTS, SEQUENTIAL_CONFIDENCE,
+                    SEQUENTIAL_PRECISION, CROSSTALK, READOUT_LENGTH)
+from utility import (make_rng, simulate_iq_batch, simulate_multiplexed_batch, calculate_fidelities,
+                     calculate_qubit_fidelities, fidelity_interval, LRUCache)
+from results import ReadoutResult, build_results, iq_statistics
 from error_handling import handle_error
+from profiling import stage
+
+DEFAULT_DRAG_BETA = 0.5
+SINGLE_QUBIT_SIGNALS = ("readout_signal", "acquire_signal", "qubit_drive")
+
+
+class PulseSpec(namedtuple("PulseSpec", ["function", "uid", "length", "amplitude", "parameters"])):
+    """
+    Lightweight description of a LabOneQ pulse_library pulse.
+
+    Simulation mode only needs the description, so LabOneQ is imported when a pulse is first built.
+    """
+
+    __slots__ = ()
+
+    def build(self):
+        """Build the LabOneQ pulse described by this spec."""
+        from laboneq.simple import pulse_library
+        return getattr(pulse_library, self.function)(uid=self.uid, length=self.length, amplitude=self.amplitude,
+                                                     **self.parameters)
 
 
 class Experiment:
     """Handles defining and running qubit readout experiments."""
 
-    def __init__(self, experiment_type='readout', device_id=None, device_config=None):
+    def __init__(self, experiment_type='readout', device_id=None, device_config=None, seed=None,
+                 discriminator=DEFAULT_DISCRIMINATOR, device_setup=None, emulation=False, noise_level=NOISE_LEVEL,
+                 num_qubits=1, crosstalk=CROSSTALK, summary_only=False, readout_length=READOUT_LENGTH):
         """Initialize the experiment class."""
         self.experiment_type = experiment_type
         self.device_id, self.device_config = device_id, device_config
-        self._setup_pulses()
+        self.rng = make_rng(seed)  # Seedable random generator for reproducible simulations
+        self.discriminator = discriminator  # State discriminator used for fidelity calculation
+        self.noise_level = noise_level  # IQ noise in simulation mode
+        self.num_qubits = num_qubits  # Qubits read out on the feedline, each with its own signals if more than one
+        self.crosstalk = crosstalk  # Fraction of each qubit's readout signal leaking into the others in simulation
+        self.summary_only = summary_only  # Keep only the IQ statistics of every result, not the shots
+        self.emulation = emulation  # Connect LabOneQ in emulation mode, no instruments required
+        self.device_setup = device_setup
+        self._session = None  # Connected once, then reused for every hardware run
+        self._compiled_experiments = LRUCache(COMPILED_CACHE_SIZE)
+        self._laboneq_pulses = {}  # LabOneQ pulses built from the pulse specs, by uid
+        self.readout_length = readout_length  # Sets up the pulses
 
-        if self.device_id:  # In case real hardware is defined
+        if self.device_id and self.device_setup is None:  # In case real hardware is defined
             try:
                 from hardware_config import get_device_setup, configure_device
-                self.device_setup = configure_device(get_device_setup(device_id))
+                self.device_setup = configure_device(get_device_setup(device_id),
+                                                     num_qubits if num_qubits > 1 else None)
             except Exception as e:
                 handle_error("Hardware Initialization Error: Failed to initialize ReadoutExperiment"
                              , e, exit_program=True)
 
+    def configure(self, seed=None, discriminator=DEFAULT_DISCRIMINATOR, summary_only=False):
+        """
+        Prepares the experiment for a new run with its own seed, discriminator and result format.
+
+        The connected session, compiled experiments and built pulses are kept, so a long-lived experiment
+        runs every job as a newly created one would, without its setup cost. Returns the experiment.
+        """
+        self.rng = make_rng(seed)
+        self.discriminator = discriminator
+        self.summary_only = summary_only
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def use_hardware(self):
+        """Whether experiments are executed through LabOneQ rather than simulated."""
+        return self.device_setup is not None
+
+    @property
+    def backend(self):
+        """Describes where experiments run: simulation, LabOneQ emulation or the hardware device."""
+        if not self.use_hardware:
+            return "simulation"
+        return "emulation" if self.emulation else f"device:{self.device_id}"
+
+    @property
+    def readout_length(self):
+        """Length of the readout pulses in seconds."""
+        return self._readout_length
+
+    @readout_length.setter
+    def readout_length(self, length):
+        self._readout_length = float(length)
+        self._setup_pulses()
+
+    @property
+    def simulated_noise_level(self):
+        """IQ noise in simulation mode, which averages down with longer readout pulses."""
+        return self.noise_level * np.sqrt(READOUT_LENGTH / self.readout_length)
+
     def _setup_pulses(self):
         """Set up available readout and qubit control pulses."""
+        length = self.readout_length
+        suffix = "" if length == READOUT_LENGTH else f"_{length * 1e9:g}ns"  # Pulses are cached by uid
         self.readout_pulses = {
-            "Gaussian": pulse_library.gaussian(uid="readout_gaussian", length=1e-6, amplitude=1.0),
-            "Square": pulse_library.const(uid="readout_square", length=1e-6, amplitude=1.0),
-            "DRAG": pulse_library.drag(uid="readout_drag", length=1e-6, amplitude=1.0, beta=0.5),
+            "Gaussian": PulseSpec("gaussian", f"readout_gaussian{suffix}", length, 1.0, {}),
+            "Square": PulseSpec("const", f"readout_square{suffix}", length, 1.0, {}),
+            "DRAG": PulseSpec("drag", f"readout_drag{suffix}", length, 1.0, {"beta": DEFAULT_DRAG_BETA}),
         }
         # Qubit state excitation pulse
-        self.pi_pulse = pulse_library.gaussian(uid="x180", length=100e-9, amplitude=1.0)
+        self.pi_pulse = PulseSpec("gaussian", "x180", 100e-9, 1.0, {})
 
-    def _create_experiment(self, pulse_type, amplitude, frequency):
-        """Create a LabOneQ experiment for readout testing."""
+    def _laboneq_pulse(self, spec):
+        """Return the LabOneQ pulse for a pulse spec, building it on first use."""
+        if spec.uid not in self._laboneq_pulses:
+            self._laboneq_pulses[spec.uid] = spec.build()
+        return self._laboneq_pulses[spec.uid]
+
+    def _validate_point(self, pulse_type, amplitude):
+        """Check that the pulse type exists and the amplitude is within the allowed range."""
         if pulse_type not in self.readout_pulses:
             raise ValueError(f"Invalid pulse type '{pulse_type}'. Must be one of {list(self.readout_pulses.keys())}")
+        return validate_value(amplitude, *DEFAULT_AMPLITUDE_RANGE)
+
+    def _create_experiment(self, pulse_type, amplitudes, frequencies, betas, num_shots=NUM_MEASUREMENTS):
+        """
+        Create a LabOneQ experiment for readout testing.
 
-        experiment = LabOneQExperiment(uid=f"{pulse_type}_A{amplitude:.2f}_F{frequency:.2f}")
-        readout_pulse = self.readout_pulses[pulse_type]
-        readout_pulse.amplitude = validate_value(amplitude, *DEFAULT_AMPLITUDE_RANGE)
-
-        # Define the real-time readout sequence
-        with experiment.acquire_loop_rt(uid="readout_loop", count=NUM_MEASUREMENTS):
-            # Measuring the qubit in its ground state (|0>)
-            with experiment.section(uid="ground_state_measurement", alignment="left"):
-                experiment.acquire(signal="readout_signal", handle="ground_state_handle", kernel=readout_pulse)
-            # Exciting the qubit to |1> state
-            with experiment.section(uid="excited_state_preparation", play_after="ground_state_measurement"):
-                experiment.play(signal="qubit_drive", pulse=self.pi_pulse)
-            # Measuring the qubit in the excited state (|1>)
-            with experiment.section(uid="excited_state_measurement", play_after="excited_state_preparation"):
-                experiment.acquire(signal="readout_signal", handle="excited_state_handle", kernel=readout_pulse)
+        Amplitude, frequency (GHz) and beta are swept together, so a single experiment measures every
+        point of the batch. The readout pulses themselves are never modified.
+        """
+        qubit = (SINGLE_QUBIT_SIGNALS, "", pulse_type, amplitudes, frequencies, betas)
+        return self._create_readout_sweep(f"{pulse_type}_readout_sweep", [qubit], num_shots)
+
+    def _create_multiplexed_experiment(self, pulse_types, amplitudes, frequencies, betas,
+                                       num_shots=NUM_MEASUREMENTS):
+        """
+        Create a LabOneQ experiment reading out all qubits in parallel on their own signals.
+
+        pulse_types holds one pulse shape per qubit, amplitudes, frequencies and betas have shape
+        (points, qubits). Every qubit is swept along its own column within one shared sweep.
+        """
+        from hardware_config import qubit_signals
+
+        amplitudes, frequencies, betas = np.asarray(amplitudes), np.asarray(frequencies), np.asarray(betas)
+        qubits = [(qubit_signals(qubit), f"q{qubit}_", pulse_type, amplitudes[:, qubit], frequencies[:, qubit],
+                   betas[:, qubit]) for qubit, pulse_type in enumerate(pulse_types)]
+        return self._create_readout_sweep("multiplexed_readout_sweep", qubits, num_shots)
+
+    def _create_readout_sweep(self, uid, qubits, num_shots):
+        """
+        Build the readout sweep experiment of one or more qubits.
+
+        Each qubit is given as ((readout, acquire, drive) signals, uid prefix, pulse_type, amplitudes,
+        frequencies, betas); its sweep parameters and acquisition handles are named with the prefix.
+        """
+        from laboneq.simple import (Experiment as LabOneQExperiment, ExperimentSignal, SweepParameter,
+                                    AcquisitionType, AveragingMode, Calibration, SignalCalibration, Oscillator,
+                                    ModulationType, SectionAlignment)
+        from hardware_config import readout_lo_frequency
+
+        experiment = LabOneQExperiment(
+            uid=uid, signals=[ExperimentSignal(signal) for signals, *_ in qubits for signal in signals])
+        if self.device_config:  # Map the experiment signals onto the logical signals of the device setup
+            experiment.set_signal_map(self.device_config)
+
+        # All readouts share the feedline's local oscillator, each qubit sweeps its own intermediate frequency
+        local_oscillator = Oscillator(uid="readout_local_oscillator", frequency=readout_lo_frequency(
+            [frequency for *_, frequencies, _ in qubits for frequency in frequencies]))
+
+        sweep_parameters, calibration, readouts = [], {}, []
+        for (readout_signal, acquire_signal, drive_signal), prefix, pulse_type, amplitudes, frequencies, betas \
+                in qubits:
+            readout_pulse = self._laboneq_pulse(self.readout_pulses[pulse_type])
+            amplitude_sweep = SweepParameter(uid=f"{prefix}amplitude_sweep", values=np.asarray(amplitudes))
+            frequency_sweep = SweepParameter(uid=f"{prefix}frequency_sweep",
+                                             values=np.asarray(frequencies) * 1e9 - local_oscillator.frequency)
+            sweep_parameters += [amplitude_sweep, frequency_sweep]
+            pulse_parameters = None
+            if pulse_type == "DRAG":
+                beta_sweep = SweepParameter(uid=f"{prefix}beta_sweep", values=np.asarray(betas))
+                sweep_parameters.append(beta_sweep)
+                pulse_parameters = {"beta": beta_sweep}
+
+            # The acquisition demodulates at the same intermediate frequency as the readout pulse
+            oscillator = Oscillator(uid=f"{prefix}readout_oscillator", frequency=frequency_sweep,
+                                    modulation_type=ModulationType.SOFTWARE)
+            for signal in (readout_signal, acquire_signal):
+                calibration[signal] = SignalCalibration(oscillator=oscillator, local_oscillator=local_oscillator)
+            readouts.append((readout_signal, acquire_signal, drive_signal, prefix, readout_pulse, amplitude_sweep,
+                             pulse_parameters))
+        experiment.set_calibration(Calibration(calibration))
+
+        def measure(state):
+            # Operations on different signals of one section run in parallel, so all qubits are read out at once
+            for readout_signal, acquire_signal, _, prefix, readout_pulse, amplitude_sweep, pulse_parameters \
+                    in readouts:
+                experiment.measure(measure_signal=readout_signal, measure_pulse=readout_pulse,
+                                   measure_pulse_amplitude=amplitude_sweep, measure_pulse_parameters=pulse_parameters,
+                                   acquire_signal=acquire_signal, handle=f"{prefix}{state}_state_handle",
+                                   integration_kernel=readout_pulse)
+
+        # Sweep the points in near-time (the readout oscillator frequency cannot be swept in real-time),
+        # each point running the real-time readout sequence
+        with experiment.sweep(uid="readout_sweep", parameter=sweep_parameters):
+            with experiment.acquire_loop_rt(uid="readout_loop", count=num_shots,
+                                            averaging_mode=AveragingMode.SINGLE_SHOT,
+                                            acquisition_type=AcquisitionType.INTEGRATION):
+                # Measuring the qubits in their ground state (|0>)
+                with experiment.section(uid="ground_state_measurement", alignment=SectionAlignment.LEFT):
+                    measure("ground")
+                # Exciting the qubits to |1> state
+                with experiment.section(uid="excited_state_preparation", play_after="ground_state_measurement"):
+                    for _, _, drive_signal, *_ in readouts:
+                        experiment.play(signal=drive_signal, pulse=self._laboneq_pulse(self.pi_pulse))
+                # Measuring the qubits in the excited state (|1>)
+                with experiment.section(uid="excited_state_measurement", play_after="excited_state_preparation"):
+                    measure("excited")
 
         return experiment
 
+    def _compile_experiment(self, pulse_type, amplitudes, frequencies, betas, num_shots):
+        """
+        Return the compiled sweep experiment, compiling it only if it is not already cached.
+
+        The key holds the swept values along with the pulse shape, readout length and shot count: LabOneQ
+        bakes the sweep values into the compiled sequencer programs and software-modulated waveforms, and
+        offers no supported way to rerun a compiled experiment with other values (replacing the pulses of a
+        compiled experiment is deprecated and cannot change the readout frequency). Experiments are reused
+        when the same points are measured again, e.g. by every round of run_adaptive or repeated calibrations.
+        """
+        key = (pulse_type, self.readout_length, num_shots, tuple(amplitudes), tuple(frequencies), tuple(betas))
+        return self._compile_cached(key, self._create_experiment, pulse_type, amplitudes, frequencies, betas,
+                                    num_shots)
+
+    def _compile_cached(self, key, create, *args):
+        """
+        Return the compiled experiment stored under key, creating and compiling it with create(*args) if needed.
+
+        Experiments are compiled for the device setup without going through the session: Session.compile
+        replaces the session's current experiment, which a pipelined run may be executing at the same time.
+        """
+        compiled_experiment = self._compiled_experiments.get(key)
+        if compiled_experiment is None:
+            from laboneq.simple import compile_experiment
+            with stage("create_experiment"):
+                experiment = create(*args)
+            with stage("compile"):
+                compiled_experiment = compile_experiment(self.device_setup, experiment)
+            self._compiled_experiments.put(key, compiled_experiment)
+        return compiled_experiment
+
     def run(self, pulse_type, amplitude, frequency, beta=None, num_shots=NUM_MEASUREMENTS):
         """Run an experiment with specified parameters."""
-        if pulse_type == "DRAG" and beta is not None:
-            self.readout_pulses["DRAG"] = pulse_library.drag(uid="readout_drag", length=1e-6, amplitude=amplitude,
-                                                             beta=beta)
+        return self.run_batch([(pulse_type, amplitude, frequency, beta)], num_shots)[0]
+
+    def run_batch(self, points, num_shots=NUM_MEASUREMENTS, rng=None):
+        """
+        Run experiments for a batch of (pulse_type, amplitude, frequency, beta) points.
 
-        experiment = self._create_experiment(pulse_type, amplitude, frequency)
+        In simulation mode all points are simulated in one vectorized pass (using rng instead of the
+        experiment's own generator if given); on hardware the points of each pulse shape are measured in a
+        single compiled sweep. Returns a list of results in the same order as the points.
+        """
+        points = list(points)
+        for pulse_type, amp, _, _ in points:
+            self._validate_point(pulse_type, amp)
 
-        if self.device_id:  # In case the experiment is set to run on real hardware
+        iq_data = self._acquire(points, num_shots, rng)
+        if iq_data is None:
+            return [None] * len(points)
+        return self._analyze(points, *iq_data)
+
+    def _acquire(self, points, num_shots, rng=None):
+        """Acquire (or simulate) the ground and excited state IQ data of points, each of shape (points, shots, 2)."""
+        if self.use_hardware:  # In case the experiment is set to run on real hardware
             try:
-                results = self._execute_on_hardware(experiment)
-                iq_data_0, iq_data_1 = results["ground_state_handle"], results["excited_state_handle"]
+                return self._execute_on_hardware(points, num_shots)
             except Exception as e:
                 handle_error("Hardware Execution Error.", e)
                 return None
         else:  # No hardware defined - simulation mode
             try:
-                iq_data_0 = np.array([simulate_iq_response("0", amplitude, frequency) for _ in range(num_shots)])
-                iq_data_1 = np.array([simulate_iq_response("1", amplitude, frequency) for _ in range(num_shots)])
+                amplitudes = [float(amp) for _, amp, _, _ in points]
+                frequencies = [float(freq) for _, _, freq, _ in points]
+                with stage("simulate"):
+                    return self._simulate(amplitudes, frequencies, num_shots, rng or self.rng)
             except Exception as e:
                 handle_error("Simulation Mode Execution Error.", e)
                 return None
 
-        return {
-            "pulse_type": pulse_type, "amplitude": amplitude, "frequency": frequency, "iq_data_0": iq_data_0.tolist(),
-            "iq_data_1": iq_data_1.tolist(), "fidelity": calculate_fidelity(iq_data_0, iq_data_1)
-        }
+    def run_adaptive(self, points, best_fidelity=0.0, max_shots=NUM_MEASUREMENTS, batch_shots=SEQUENTIAL_BATCH_SHOTS,
+                     confidence=SEQUENTIAL_CONFIDENCE, precision=SEQUENTIAL_PRECISION, rng=None):
+        """
+        Run points with sequential measurement, acquiring shots in batches only while they are informative.
+
+        A point stops once the upper bound of its fidelity confidence interval falls below best_fidelity or
+        below the lower bound of another point of the batch (it is statistically worse), once the interval
+        half-width is below precision, or after max_shots shots per state. Results include the shots per
+        state used and the fidelity interval.
+        """
+        points = list(points)
+        for pulse_type, amp, _, _ in points:
+            self._validate_point(pulse_type, amp)
+
+        iq_data_0, iq_data_1 = np.empty((2, len(points), max_shots, 2))
+        shots = np.zeros(len(points), dtype=int)
+        fidelities, lower, upper = np.zeros(len(points)), np.zeros(len(points)), np.ones(len(points))
+        active = np.arange(len(points))
+
+        while active.size:
+            # All active points have acquired the same number of shots, so their data stays stacked
+            start = shots[active[0]]
+            num_shots = min(batch_shots, max_shots - start)
+            # Only the active points are measured. On hardware, rounds measuring the same points reuse one
+            # compiled experiment, a new one is compiled only when points finish
+            iq_data = self._acquire([points[idx] for idx in active], num_shots, rng)
+            if iq_data is None:
+                return [None] * len(points)
+            iq_data_0[active, start:start + num_shots], iq_data_1[active, start:start + num_shots] = iq_data
+            shots[active] += num_shots
+
+            end = start + num_shots
+            with stage("fidelity"):
+                fidelities[active] = calculate_fidelities(iq_data_0[active, :end], iq_data_1[active, :end],
+                                                          self.discriminator)
+            lower[active], upper[active] = fidelity_interval(fidelities[active], end, confidence)
+
+            threshold = max(best_fidelity, lower.max())
+            finished = ((upper[active] < threshold) | ((upper[active] - lower[active]) / 2 < precision)
+                        | (shots[active] >= max_shots))
+            active = active[~finished]
+
+        with stage("build_results"):  # Points that stopped early leave the rest of their buffer unset
+            return [self._build_result(point, iq_data_0[idx, :shots[idx]].astype(np.float32),
+                                       iq_data_1[idx, :shots[idx]].astype(np.float32),
+                                       fidelities[idx], shots=int(shots[idx]), fidelity_low=float(lower[idx]),
+                                       fidelity_high=float(upper[idx]))
+                    for idx, point in enumerate(points)]
+
+    def run_multiplexed(self, points, num_shots=NUM_MEASUREMENTS, rng=None):
+        """
+        Read out several qubits in parallel for a batch of multiplexed points.
+
+        Each point holds one (pulse_type, amplitude, frequency, beta) tuple per qubit. In simulation mode
+        all points and qubits are simulated in one vectorized pass including crosstalk, on hardware the
+        points sharing their pulse shapes are measured in a single compiled sweep. Per-qubit fidelities
+        are computed in one batched call. Returns, for every point, the list of per-qubit results.
+        """
+        points = [tuple(point) for point in points]
+        if any(len(point) != len(points[0]) for point in points):
+            raise ValueError("Every multiplexed point must hold the parameters of the same number of qubits.")
+        for point in points:
+            for pulse_type, amp, _, _ in point:
+                self._validate_point(pulse_type, amp)
+
+        iq_data = self._acquire_multiplexed(points, num_shots, rng)
+        if iq_data is None:
+            return [None] * len(points)
+
+        iq_data_0, iq_data_1 = iq_data
+        with stage("fidelity"):
+            fidelities = calculate_qubit_fidelities(iq_data_0, iq_data_1, self.discriminator)
+        with stage("build_results"):
+            qubit_results = [build_results([point[qubit] for point in points], iq_data_0[:, qubit],
+                                           iq_data_1[:, qubit], fidelities[:, qubit], self.summary_only)
+                             for qubit in range(len(points[0]))]
+        for qubit, results in enumerate(qubit_results):
+            for result in results:
+                result.update(qubit=qubit)
+        return [list(results) for results in zip(*qubit_results)]
+
+    def _acquire_multiplexed(self, points, num_shots, rng=None):
+        """Acquire (or simulate) the IQ data of multiplexed points, each of shape (points, qubits, shots, 2)."""
+        if self.use_hardware:
+            try:
+                return self._execute_multiplexed_on_hardware(points, num_shots)
+            except Exception as e:
+                handle_error("Hardware Execution Error.", e)
+                return None
+        else:
+            try:
+                amplitudes = [[float(amp) for _, amp, _, _ in point] for point in points]
+                frequencies = [[float(freq) for _, _, freq, _ in point] for point in points]
+                with stage("simulate"):
+                    rng = rng or self.rng
+                    return tuple(simulate_multiplexed_batch(state, amplitudes, frequencies, num_shots, self.crosstalk,
+                                                            self.simulated_noise_level, rng) for state in ("0", "1"))
+            except Exception as e:
+                handle_error("Simulation Mode Execution Error.", e)
+                return None
+
+    def run_pipelined(self, points, num_shots=NUM_MEASUREMENTS, backend=None, job_size=1,
+                      queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        Run (pulse_type, amplitude, frequency, beta) points through a compile/execute/analyze pipeline.
+
+        While one job (up to job_size consecutive points of the same pulse shape) is executing, the next
+        job is compiled and the previous one analyzed. Results are yielded in point order as they complete.
+        The backend defaults to LabOneQ for hardware experiments and to the simulator otherwise.
+        """
+        from pipeline import ExperimentPipeline, LabOneQBackend, SimulationBackend
+
+        points = list(points)
+        for pulse_type, amp, _, _ in points:
+            self._validate_point(pulse_type, amp)
+        if backend is None:
+            backend = LabOneQBackend(self) if self.use_hardware else SimulationBackend(self)
+        yield from ExperimentPipeline(backend, self._analyze, queue_size).run(points, num_shots, job_size)
+
+    def _analyze(self, points, iq_data_0, iq_data_1):
+        """Compute the fidelities of a batch of points in one vectorized call and build their results."""
+        with stage("fidelity"):
+            fidelities = calculate_fidelities(iq_data_0, iq_data_1, self.discriminator)
+        with stage("build_results"):
+            return build_results(points, iq_data_0, iq_data_1, fidelities, self.summary_only)
+
+    def _simulate(self, amplitudes, frequencies, num_shots, rng):
+        """Simulate ground and excited state IQ data, each of shape (points, shots, 2)."""
+        noise_level = self.simulated_noise_level
+        return (simulate_iq_batch("0", amplitudes, frequencies, num_shots, noise_level, rng),
+                simulate_iq_batch("1", amplitudes, frequencies, num_shots, noise_level, rng))
+
+    def _build_result(self, point, iq_data_0, iq_data_1, fidelity, **extra):
+        """Package the IQ data of a single parameter point into a result, or only its statistics if summary_only."""
+        pulse_type, amplitude, frequency, beta = point
+        if self.summary_only:
+            return ReadoutResult(pulse_type, amplitude, frequency, fidelity, beta=beta,
+                                 statistics=iq_statistics(iq_data_0, iq_data_1), **extra)
+        return ReadoutResult(pulse_type, amplitude, frequency, fidelity, iq_data_0, iq_data_1, beta=beta, **extra)
+
+    def _get_session(self):
+        """Return the connected LabOneQ session, creating and connecting it on first use."""
+        if self._session is None:
+            from laboneq.simple import Session
+            with stage("connect"):
+                session = Session(self.device_setup)
+                session.connect(do_emulation=self.emulation)
+            self._session = session
+        return self._session
+
+    def close(self):
+        """Disconnect the LabOneQ session and drop the compiled experiments."""
+        if self._session is not None:
+            self._session.disconnect()
+            self._session = None
+        self._compiled_experiments.clear()
+
+    def _execute_on_hardware(self, points, num_shots):
+        """Execute the experiment on real hardware using LabOneQ, one compiled sweep per pulse shape."""
+        iq_data_0 = np.empty((len(points), num_shots, 2))
+        iq_data_1 = np.empty((len(points), num_shots, 2))
+
+        for pulse_type in dict.fromkeys(pulse for pulse, _, _, _ in points):
+            indices = [idx for idx, point in enumerate(points) if point[0] == pulse_type]
+            compiled_experiment = self._compile_points([points[idx] for idx in indices], num_shots)
+            iq_data_0[indices], iq_data_1[indices] = self._run_compiled(compiled_experiment, len(indices), num_shots)
+
+        return iq_data_0, iq_data_1
+
+    def _execute_multiplexed_on_hardware(self, points, num_shots):
+        """Execute multiplexed points with LabOneQ, one compiled sweep per combination of pulse shapes."""
+        num_qubits = len(points[0])
+        iq_data_0 = np.empty((len(points), num_qubits, num_shots, 2))
+        iq_data_1 = np.empty((len(points), num_qubits, num_shots, 2))
+
+        point_pulses = [tuple(pulse for pulse, _, _, _ in point) for point in points]
+        for pulse_types in dict.fromkeys(point_pulses):
+            indices = [idx for idx, pulses in enumerate(point_pulses) if pulses == pulse_types]
+            amplitudes = [[float(amp) for _, amp, _, _ in points[idx]] for idx in indices]
+            frequencies = [[float(freq) for _, _, freq, _ in points[idx]] for idx in indices]
+            betas = [[DEFAULT_DRAG_BETA if beta is None else float(beta) for _, _, _, beta in points[idx]]
+                     for idx in indices]
+            key = ("multiplexed", pulse_types, self.readout_length, num_shots, str(amplitudes), str(frequencies),
+                   str(betas))
+            compiled_experiment = self._compile_cached(key, self._create_multiplexed_experiment, pulse_types,
+                                                       amplitudes, frequencies, betas, num_shots)
+
+            session = self._get_session()
+            with stage("execute"):
+                results = session.run(compiled_experiment)
+            for qubit in range(num_qubits):
+                iq_data_0[indices, qubit] = self._to_iq(results.get_data(f"q{qubit}_ground_state_handle"),
+                                                        len(indices), num_shots)
+                iq_data_1[indices, qubit] = self._to_iq(results.get_data(f"q{qubit}_excited_state_handle"),
+                                                        len(indices), num_shots)
+
+        return iq_data_0, iq_data_1
+
+    def _compile_points(self, points, num_shots):
+        """Return the compiled sweep experiment for points that all share one pulse shape."""
+        amplitudes = [float(amp) for _, amp, _, _ in points]
+        frequencies = [float(freq) for _, _, freq, _ in points]
+        betas = [DEFAULT_DRAG_BETA if beta is None else float(beta) for _, _, _, beta in points]
+        return self._compile_experiment(points[0][0], amplitudes, frequencies, betas, num_shots)
+
+    def _run_compiled(self, compiled_experiment, num_points, num_shots):
+        """Run a compiled sweep experiment and return its ground and excited state IQ data."""
+        session = self._get_session()
+        with stage("execute"):
+            results = session.run(compiled_experiment)
+        return (self._to_iq(results.get_data("ground_state_handle"), num_points, num_shots),
+                self._to_iq(results.get_data("excited_state_handle"), num_points, num_shots))
 
-    def _execute_on_hardware(self, experiment):
-        """Execute the experiment on real hardware using LabOneQ."""
-        session = Session()
-        session.connect(device_id=self.device_id) if self.device_id else session.connect_simulator()
-        return session.run(experiment)
+    @staticmethod
+    def _to_iq(data, num_points, num_shots):
+        """Convert complex single-shot data of shape (points, shots) into IQ pairs of shape (points, shots, 2)."""
+        data = np.asarray(data).reshape(num_points, num_shots)
+        return np.stack([data.real, data.imag], axis=-1)
@@ -2,7 +2,9 @@
 This module handles hardware configuration and connectivity.
 """
 
+import numpy as np
 from laboneq.simple import DeviceSetup
+from config import READOUT_LO_STEP, READOUT_MAX_IF
 
 
 def get_device_setup(device_id=None):
@@ -15,8 +17,42 @@ def get_device_setup(device_id=None):
         return DeviceSetup.simulator()
 
 
-def configure_device(device_setup):
-    """Configure the experiment hardware device."""
-    device_setup.configure_channel("readout_signal", port=1)
-    device_setup.configure_channel("qubit_drive", port=2)
+def qubit_signals(qubit):
+    """Names of the readout, acquisition and drive signals of a qubit in a multiplexed setup."""
+    return f"q{qubit}_readout_signal", f"q{qubit}_acquire_signal", f"q{qubit}_drive"
+
+
+def readout_lo_frequency(frequencies):
+    """
+    Local oscillator frequency (Hz) of a feedline reading out at the given frequencies (GHz).
+
+    The LO is placed on the READOUT_LO_STEP grid, in the middle of the frequencies, and every readout runs at
+    its own intermediate frequency (frequency - LO), which must stay within READOUT_MAX_IF of the LO.
+    """
+    frequencies = np.asarray(frequencies, dtype=float) * 1e9
+    lo_frequency = np.round((frequencies.min() + frequencies.max()) / 2 / READOUT_LO_STEP) * READOUT_LO_STEP
+    if np.abs(frequencies - lo_frequency).max() > READOUT_MAX_IF:
+        raise ValueError(f"Readout frequencies span more than one local oscillator can reach "
+                         f"(±{READOUT_MAX_IF / 1e6:g} MHz intermediate frequency).")
+    return float(lo_frequency)
+
+
+def configure_device(device_setup, num_qubits=None):
+    """
+    Configure the experiment hardware device.
+
+    Without num_qubits a single qubit is wired. Otherwise every qubit gets its own signals (see
+    qubit_signals): all readout and acquisition signals share the feedline port, each drive has its own port.
+    """
+    if num_qubits is None:
+        device_setup.configure_channel("readout_signal", port=1)
+        device_setup.configure_channel("acquire_signal", port=1)
+        device_setup.configure_channel("qubit_drive", port=2)
+        return device_setup
+
+    for qubit in range(num_qubits):
+        readout_signal, acquire_signal, drive_signal = qubit_signals(qubit)
+        device_setup.configure_channel(readout_signal, port=1)
+        device_setup.configure_channel(acquire_signal, port=1)
+        device_setup.configure_channel(drive_signal, port=2 + qubit)
     return device_setup
@@ -1,52 +1,76 @@
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
 from experiment import Experiment
-from data_handler import save_results
+from evaluation_cache import EvaluationCache
+from data_handler import save_results, results_path, ResultsWriter
+from plotting import plot_iq_results, plot_sweep_page, PAGE_COLUMNS, PAGE_TILES
+from sweep import Sweep, run_sweep
 from error_handling import handle_error
-from config import AMPLITUDE_SCALING, FREQUENCY_SCALING, PULSE_SHAPES
+import profiling
+from profiling import stage
+from config import (AMPLITUDE_SCALING, FREQUENCY_SCALING, PULSE_SHAPES, DEFAULT_DISCRIMINATOR,
+                    DENSITY_SHOT_THRESHOLD, SIMULATION_BATCH_SIZE, SWEEP_POINTS)
+from utility import DISCRIMINATORS
+from optimization import OPTIMIZERS
 
 
-def plot_iq_results(results, mode, sweep_param):
-    """Plots IQ results for both single and range modes."""
-    pulse_shapes = sorted(set(res["pulse_type"] for res in results))
-    param_values = sorted(set(res[sweep_param] for res in results))
+def run_experiment(mode, manual_mode, pulse, amplitude, frequency, sweep_param, save_data, save_format, opt_steps=5,
+                   seed=None, discriminator=DEFAULT_DISCRIMINATOR, optimizer="grid",
+                   workers=1, use_cache=False, plot_output=None, plot_format="png",
+                   density_threshold=DENSITY_SHOT_THRESHOLD, show_plot=True,
+                   adaptive_shots=False, num_qubits=1, summary_only=False, beta=None, length=None,
+                   sweep_points=None, sweep_mode="product", experiment=None, progress=None, on_results=None):
+    """
+    Runs the experiment using ReadoutExperiment class.
 
-    num_rows, num_cols = len(pulse_shapes), len(param_values)
-    fig, axes = plt.subplots(num_rows, num_cols, figsize=(15, num_rows * 3), squeeze=False)
-
-    for row_idx, pulse in enumerate(pulse_shapes):
-        for col_idx, param in enumerate(param_values):
-            result = next(res for res in results if res["pulse_type"] == pulse and res[sweep_param] == param)
-            iq_data_0, iq_data_1 = np.array(result["iq_data_0"]), np.array(result["iq_data_1"])
-
-            ax = axes[row_idx, col_idx]
-            ax.scatter(iq_data_0[:, 0], iq_data_0[:, 1], color="blue", alpha=0.5, label="|0⟩")
-            ax.scatter(iq_data_1[:, 0], iq_data_1[:, 1], color="red", alpha=0.5, label="|1⟩")
-            ax.set_title(f"{pulse}, {sweep_param.capitalize()}={param:.2f}\nFidelity: {result['fidelity']:.3f}")
-            ax.set_xlabel("I")
-            ax.set_ylabel("Q")
-            ax.legend()
-            ax.grid()
-
-    plt.suptitle(f"IQ Response for Pulse Shapes & {sweep_param.capitalize()} Sweep")
-    plt.tight_layout()
-    plt.show()
-
-
-def run_experiment(mode, manual_mode, pulse, amplitude, frequency, sweep_param, save_data, save_format, opt_steps=5):
-    """Runs the experiment using ReadoutExperiment class."""
+    A long-lived Experiment can be passed in to run on its connected session and warm caches. Progress is
+    then reported as progress(count, total) instead of console progress bars (if given), and on_results is
+    called with every list of results as soon as it is available.
+    """
     try:
         if mode == "automatic":  # The program automatically optimizes the best parameters
 
-            from optimization import basic_optimization
+            from optimization import basic_optimization, multiplexed_optimization
             pulse_shapes = PULSE_SHAPES if pulse == "all" else [pulse]
+            if experiment is not None:  # Only the fidelities are used, so the experiment does not keep the shots
+                experiment.configure(seed, discriminator, summary_only=True)
+
+            if num_qubits > 1:  # Calibrate all qubits of the feedline with one multiplexed sweep
+                qubit_ranges = [((amp * (1 - AMPLITUDE_SCALING), amp * (1 + AMPLITUDE_SCALING)),
+                                 (freq * (1 - FREQUENCY_SCALING), freq * (1 + FREQUENCY_SCALING)))
+                                for amp, freq in zip(amplitude, frequency)]
+                results = multiplexed_optimization(pulse_shapes, qubit_ranges, opt_steps, seed=seed,
+                                                   discriminator=discriminator, experiment=experiment,
+                                                   progress=progress)
+                for result in results:
+                    beta_str = f", Beta={result['beta']:.3f}" if result["pulse_type"] == "DRAG" else ""
+                    print(f"Qubit {result['qubit']}: best parameters are {result['pulse_type']} pulse, "
+                          f"Amplitude={result['amplitude']:.3f}, "
+                          f"Frequency={result['frequency']:.3f}{beta_str}, "
+                          f"Fidelity={result['fidelity']:.3f}")
+                print(f"Experiment evaluations used: {results[0]['evaluations']} "
+                      f"({results[0]['shots']} shots per state)")
+                if on_results is not None:
+                    on_results(results)
+
+                if save_data:
+                    save_results(results, save_format)
+                return
 
             amp_range = (amplitude * (1 - AMPLITUDE_SCALING), amplitude * (1 + AMPLITUDE_SCALING))
             freq_range = (frequency * (1 - FREQUENCY_SCALING), frequency * (1 + FREQUENCY_SCALING))
 
-            # Call the optimization function
-            results = basic_optimization(pulse_shapes, amp_range, freq_range, opt_steps)
+            # Call the optimization function, reusing evaluations of earlier runs if the cache is enabled
+            cache = EvaluationCache() if use_cache else None
+            try:
+                results = basic_optimization(pulse_shapes, amp_range, freq_range, opt_steps, seed=seed,
+                                             discriminator=discriminator, method=optimizer,
+                                             workers=workers, cache=cache, adaptive_shots=adaptive_shots,
+                                             experiment=experiment, progress=progress)
+            finally:
+                if cache is not None:
+                    print(cache.summary())
+                    cache.close()
 
             # Display results
             beta_str = f", Beta={results['beta']:.3f}" if results["pulse_type"] == "DRAG" else ""
@@ -54,28 +78,35 @@ def run_experiment(mode, manual_mode, pulse, amplitude, frequency, sweep_param,
                   f"Amplitude={results['amplitude']:.3f}, "
                   f"Frequency={results['frequency']:.3f}{beta_str}, "
                   f"Fidelity={results['fidelity']:.3f}")
+            print(f"Experiment evaluations used: {results['evaluations']} ({results['shots']} shots per state)")
+            if on_results is not None:
+                on_results([results])
 
             if save_data:
                 save_results(results, save_format)
 
         elif mode == "manual":  # The program outputs the experiment results for manual analysis and optimization
-            experiment = Experiment()
+            experiment = Experiment(seed=seed, discriminator=discriminator, summary_only=summary_only) \
+                if experiment is None else experiment.configure(seed, discriminator, summary_only)
             results = []
             pulse_shapes = PULSE_SHAPES if pulse == "all" else [pulse]
 
             if manual_mode == "single":  # Run a single experiment
                 for pulse_type in pulse_shapes:
                     results.append(experiment.run(pulse_type, amplitude, frequency))
-            elif manual_mode == "range":  # Sweep over the selected parameter
-                amplitude_values = np.linspace(*amplitude, 4) if sweep_param == "amplitude" else [amplitude]
-                frequency_values = np.linspace(*frequency, 4) if sweep_param == "frequency" else [frequency]
-
-                for pulse_type in pulse_shapes:
-                    for amp in amplitude_values:
-                        for freq in frequency_values:
-                            results.append(experiment.run(pulse_type, amp, freq))
+                    if progress is not None:
+                        progress(1, len(pulse_shapes))
+                if on_results is not None:
+                    on_results(results)
+            elif manual_mode == "range":  # Sweep over the selected parameters, streaming the results
+                run_range_sweep(experiment, pulse_shapes, amplitude, frequency, beta, length, sweep_points,
+                                sweep_mode, save_data, save_format, workers, seed, plot_output, plot_format,
+                                density_threshold, show_plot, progress, on_results)
+                return
 
-            plot_iq_results(results, manual_mode, sweep_param)
+            if show_plot or plot_output is not None:
+                plot_iq_results(results, manual_mode, sweep_param, plot_output, plot_format, workers,
+                                density_threshold)
 
             if save_data:
                 save_results(results, save_format)
@@ -84,8 +115,66 @@ def run_experiment(mode, manual_mode, pulse, amplitude, frequency, sweep_param,
         handle_error("Experiment execution failed", e, exit_program=True)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run a qubit readout experiment.")
+def sweep_values(values, num_points):
+    """Returns a single value as is, or num_points values spanning a (min, max) range."""
+    if np.ndim(values) == 0:
+        return [values]
+    return list(np.linspace(*values, num_points)) if values[0] != values[1] else [values[0]]
+
+
+def run_range_sweep(experiment, pulse_shapes, amplitude, frequency, beta, length, sweep_points, sweep_mode,
+                    save_data, save_format, workers, seed, plot_output, plot_format, density_threshold, show_plot,
+                    progress=None, on_results=None):
+    """
+    Runs a range mode sweep over any of amplitude, frequency, beta and readout length (in ns).
+
+    Each parameter is a single value or a (min, max) range of sweep_points[parameter] points, combined as a
+    Cartesian product or zipped. Results are saved and plotted page by page while the sweep runs, and
+    every chunk is reported to the optional progress and on_results callbacks (see run_experiment).
+    """
+    sweep_points = sweep_points or {}
+    axes = {"amplitude": amplitude, "frequency": frequency, "beta": beta,
+            "length": None if length is None else np.multiply(length, 1e-9)}
+    sweep = Sweep(zipped=sweep_mode == "zip", pulse_type=pulse_shapes,
+                  **{axis: sweep_values(values, sweep_points.get(axis, SWEEP_POINTS))
+                     for axis, values in axes.items() if values is not None})
+
+    # Pages hold whole rows of the innermost swept parameter, and the sweep chunks hold whole pages
+    columns = min(sweep.columns, PAGE_COLUMNS)
+    page_size = columns * max(PAGE_TILES // columns, 1)
+    chunk_size = page_size * max(SIMULATION_BATCH_SIZE // page_size, 1)
+    # Every shown page opens a blocking window, so only the first one is shown unless pages are written to files
+    plot_pages = float("inf") if plot_output is not None else 1 if show_plot else 0
+    if plot_pages == 1 and len(sweep) > page_size:
+        print(f"Plotting the first {page_size} of {len(sweep)} points, use --plot_output to plot every page.")
+
+    writer = ResultsWriter(save_format, [axis for axis in ("beta", "length") if axis in sweep.swept]) \
+        if save_data else None
+    try:
+        page = 0
+        for chunk in run_sweep(experiment, sweep, workers, seed, chunk_size=chunk_size):
+            if writer is not None:
+                with stage("save_results"):
+                    writer.write(chunk)
+            for start in range(0, len(chunk), page_size):
+                if page >= plot_pages:
+                    break
+                plot_sweep_page(chunk[start:start + page_size], page, sweep.swept, columns, plot_output,
+                                plot_format, workers, density_threshold)
+                page += 1
+            if progress is not None:
+                progress(len(chunk), len(sweep))
+            if on_results is not None:
+                on_results(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+            print(f"Results saved to {writer.path}")
+
+
+def build_parser(description="Run a qubit readout experiment."):
+    """Builds the command line parser of the experiment arguments, shared with the calibration daemon client."""
+    parser = argparse.ArgumentParser(description=description)
 
     # Handle main mode selection
     parser.add_argument("--mode", choices=["automatic", "manual"], required=True,
@@ -98,22 +187,77 @@ if __name__ == "__main__":
                         help="Readout pulse shape ('all' to sweep over all shapes)")
     # Handle parameter selection
     parser.add_argument("--amplitude", nargs="+", type=float, required=True,
-                        help="For single mode enter one value. For range mode enter min and max values (e.g., 0.5 2.0)")
+                        help="For single mode enter one value. For range mode enter one value or min and max values "
+                             "(e.g., 0.5 2.0)")
     parser.add_argument("--frequency", nargs="+", type=float, required=True,
-                        help="For single mode enter one value. For range mode enter min and max values (e.g., 6.4 6.6)")
+                        help="For single mode enter one value. For range mode enter one value or min and max values "
+                             "(e.g., 6.4 6.6)")
     # Handle parameter sweep settings (only for Range mode)
-    parser.add_argument("--sweep_param", choices=["amplitude", "frequency"], default="amplitude",
-                        help="Choose whether columns represent amplitude or frequency variations in range mode.")
+    parser.add_argument("--beta", nargs="+", type=float, default=None,
+                        help="DRAG beta for range mode: one value or min and max values")
+    parser.add_argument("--length", nargs="+", type=float, default=None,
+                        help="Readout pulse length in ns for range mode: one value or min and max values")
+    parser.add_argument("--points", nargs="+", default=[], metavar="PARAMETER=N",
+                        help=f"Points per swept parameter in range mode, e.g. amplitude=8 beta=3 "
+                             f"(default {SWEEP_POINTS} each)")
+    parser.add_argument("--sweep_mode", choices=["product", "zip"], default="product",
+                        help="Sweep every combination of the ranges, or step through them together in range mode")
+    parser.add_argument("--sweep_param", choices=["amplitude", "frequency"], default=None,
+                        help="Choose whether columns represent amplitude or frequency variations in single mode "
+                             "(default amplitude). Ignored in range mode, which sweeps every parameter given as min "
+                             "and max values.")
     # Handle data saving options
     parser.add_argument("--save", action="store_true",
                         help="Flag to save results")
-    parser.add_argument("--format", choices=["json", "csv"], default="json",
-                        help="File format for saving results")
+    parser.add_argument("--format", choices=["json", "csv", "bin"], default="json",
+                        help="File format for saving results ('bin' is a memory-mappable float32 shot store)")
+    parser.add_argument("--summary_only", action="store_true",
+                        help="Keep only the IQ means, covariances and shot counts of every result instead of the "
+                             "shots (plots show covariance ellipses, BIN saving is not available)")
+    # Handle plotting options (only relevant for Manual mode)
+    parser.add_argument("--plot_output", default=None,
+                        help="Write the IQ plot to this path (without extension) instead of showing it")
+    parser.add_argument("--no_plot", action="store_true",
+                        help="Do not show the IQ plot (it is still written if --plot_output is given)")
+    parser.add_argument("--plot_format", choices=["png", "svg"], default="png",
+                        help="Image format for --plot_output")
+    parser.add_argument("--density_threshold", type=int, default=DENSITY_SHOT_THRESHOLD,
+                        help="Shots per state above which IQ plots show a density instead of single shots")
     # Handle optimization arguments (Only relevant for Automatic mode)
     parser.add_argument("--opt_steps", type=int, default=5,
                         help="Number of steps per parameter for optimization (only in automatic mode)")
+    parser.add_argument("--optimizer", choices=["grid"] + list(OPTIMIZERS), default="grid",
+                        help="Optimization strategy: exhaustive grid search or an adaptive optimizer "
+                             "(only in automatic mode)")
+    # Handle parallel execution
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes for grid searches and sweeps (simulation mode)")
+    parser.add_argument("--adaptive_shots", action="store_true",
+                        help="Acquire shots in batches and stop early on points that are clearly worse than the best "
+                             "(only in automatic mode)")
+    parser.add_argument("--qubits", type=int, default=1,
+                        help="Number of qubits read out on the feedline, calibrated together by one multiplexed "
+                             "grid search (only in automatic mode). Give one amplitude and frequency per qubit, "
+                             "or one value for all of them")
+    # Handle the persistent evaluation cache
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse evaluations stored by earlier runs and store new ones (only in automatic mode)")
+    # Handle profiling
+    parser.add_argument("--profile", action="store_true",
+                        help="Print a per-stage timing summary and write a Chrome trace timeline to the results folder")
+    # Handle simulation reproducibility
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for reproducible simulation runs")
+    # Handle state discrimination method used for fidelity calculation
+    parser.add_argument("--discriminator", choices=list(DISCRIMINATORS), default=DEFAULT_DISCRIMINATOR,
+                        help="State discriminator used to compute the readout fidelity")
 
-    args = parser.parse_args()
+    return parser
+
+
+def parse_job(parser, argv=None):
+    """Parses and validates the experiment arguments. Returns them and the run_experiment keyword arguments."""
+    args = parser.parse_args(argv)
 
     # Validate input parameters correctness
     if args.mode == "manual":
@@ -126,27 +270,75 @@ if __name__ == "__main__":
             amplitude = args.amplitude[0]
             frequency = args.frequency[0]
         elif args.manual_mode == "range":
-            if args.sweep_param == "amplitude":
-                if len(args.amplitude) != 2 or len(args.frequency) != 1:
-                    parser.error("Amplitude sweep requires two amplitude values (min, max) and one frequency value.")
-                amplitude = tuple(args.amplitude)
-                frequency = args.frequency[0]
-            else:  # frequency sweep
-                if len(args.frequency) != 2 or len(args.amplitude) != 1:
-                    parser.error("Frequency sweep requires two frequency values (min, max) and one amplitude value.")
-                frequency = tuple(args.frequency)
-                amplitude = args.amplitude[0]
-    elif args.mode == "automatic":
-        # Ensure exactly one amplitude and frequency value for automatic mode
-        if len(args.amplitude) != 1 or len(args.frequency) != 1:
-            parser.error("Automatic mode requires exactly one starting value for amplitude and frequency.")
+            ranges = {"amplitude": args.amplitude, "frequency": args.frequency, "beta": args.beta,
+                      "length": args.length}
+            for name, values in ranges.items():
+                if values is not None and len(values) not in (1, 2):
+                    parser.error(f"Range mode requires one {name} value or two (min, max).")
+            if args.sweep_param is not None:
+                print("Note: --sweep_param is ignored in range mode, which sweeps every parameter given as min and "
+                      "max values.")
+            amplitude, frequency, beta, length = (None if values is None else values[0] if len(values) == 1
+                                                  else tuple(values) for values in ranges.values())
 
+            try:
+                sweep_points = {name: int(count) for name, count in (item.split("=") for item in args.points)}
+            except ValueError:
+                parser.error("--points entries must look like PARAMETER=N, e.g. amplitude=8.")
+            if set(sweep_points) - set(ranges) or any(count <= 0 for count in sweep_points.values()):
+                parser.error(f"--points takes positive counts for {', '.join(ranges)}.")
+    elif args.mode == "automatic":
         if args.opt_steps <= 0:
             parser.error("--opt_steps must be a positive integer.")
 
-        amplitude = args.amplitude[0]
-        frequency = args.frequency[0]
+        if args.qubits > 1:  # One starting value per qubit, or a single value shared by all qubits
+            if {len(args.amplitude), len(args.frequency)} - {1, args.qubits}:
+                parser.error("Multiplexed mode requires one amplitude and frequency value, or one per qubit.")
+            if args.optimizer != "grid" or args.adaptive_shots or args.cache:
+                parser.error("Multiplexed mode supports only the grid optimizer, without --adaptive_shots or --cache.")
+            amplitude = args.amplitude * (args.qubits // len(args.amplitude))
+            frequency = args.frequency * (args.qubits // len(args.frequency))
+        else:
+            # Ensure exactly one amplitude and frequency value for automatic mode
+            if len(args.amplitude) != 1 or len(args.frequency) != 1:
+                parser.error("Automatic mode requires exactly one starting value for amplitude and frequency.")
+
+            amplitude = args.amplitude[0]
+            frequency = args.frequency[0]
+
+    if args.manual_mode != "range":
+        beta = length = sweep_points = None
+
+    if args.summary_only and args.save and args.format == "bin":
+        parser.error("--summary_only results have no shots to save in BIN format.")
+    if args.mode == "automatic" and args.save and args.format == "bin":
+        parser.error("Automatic mode results have no shots to save in BIN format.")
+
+    if args.workers <= 0:
+        parser.error("--workers must be a positive integer.")
+    if args.qubits <= 0:
+        parser.error("--qubits must be a positive integer.")
+
+    sweep_param = args.sweep_param or "amplitude"
+    job = dict(mode=args.mode, manual_mode=args.manual_mode if args.mode == "manual" else None, pulse=args.pulse,
+               amplitude=amplitude, frequency=frequency, sweep_param=sweep_param, save_data=args.save,
+               save_format=args.format, opt_steps=args.opt_steps, seed=args.seed, discriminator=args.discriminator,
+               optimizer=args.optimizer, workers=args.workers, use_cache=args.cache, plot_output=args.plot_output,
+               plot_format=args.plot_format, density_threshold=args.density_threshold, show_plot=not args.no_plot,
+               adaptive_shots=args.adaptive_shots, num_qubits=args.qubits, summary_only=args.summary_only,
+               beta=beta, length=length, sweep_points=sweep_points, sweep_mode=args.sweep_mode)
+    return args, job
+
+
+if __name__ == "__main__":
+    args, job = parse_job(build_parser())
+
+    if args.profile:
+        profiling.enable()
 
     # Run the experiment
-    run_experiment(args.mode, args.manual_mode if args.mode == "manual" else None,
-                   args.pulse, amplitude, frequency, args.sweep_param, args.save, args.format, args.opt_steps)
+    run_experiment(**job)
+
+    if args.profile:
+        print(profiling.summary())
+        print(f"Profile trace saved to {profiling.write_trace(results_path('trace.json'))}")
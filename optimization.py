@@ -2,43 +2,343 @@
 This module contains automated readout parameter optimizations.
 """
 
+import math
 import numpy as np
 import sys
+from contextlib import contextmanager
 from tqdm import tqdm
 from experiment import Experiment
+from executor import evaluate_points
+from evaluation_cache import evaluation_key, cache_entry
+from config import NUM_MEASUREMENTS, SIMULATION_BATCH_SIZE, DEFAULT_DISCRIMINATOR, OPTIMIZER_MAX_EVALUATIONS, BETA_RANGE
 
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+@contextmanager
+def _progress(total, desc, progress=None):
+    """Yields an update(count) function: a console progress bar's, or progress(count, total) if it is given."""
+    if progress is not None:
+        yield lambda count: progress(count, total)
+        return
+    with tqdm(total=total, desc=desc, file=sys.stdout) as pbar:
+        yield pbar.update
 
-def basic_optimization(pulse_types, amplitude_range, frequency_range, steps=5):
-    """A basic algorithm for grid-search type optimization."""
-    experiment = Experiment()
-    best_fidelity = 0
-    best_params = None
 
+def grid_points(pulse_types, amplitude_range, frequency_range, steps=5):
+    """Build the list of (pulse_type, amplitude, frequency, beta) points covered by the grid search."""
     amp_values = np.linspace(amplitude_range[0], amplitude_range[1], steps)
     freq_values = np.linspace(frequency_range[0], frequency_range[1], steps)
 
-    # Compute total number of iterations based on the number of values to go over
-    total_iterations = sum(len(amp_values) * len(freq_values) * (steps if pulse == "DRAG" else 1) for pulse in pulse_types)
+    points = []
+    for pulse in pulse_types:
+        beta_values = np.linspace(*BETA_RANGE, steps) if pulse == "DRAG" else [None]
+        points.extend((pulse, amp, freq, beta) for amp in amp_values for freq in freq_values for beta in beta_values)
+    return points
+
+
+class _Objective:
+    """
+    Evaluates one pulse shape at points of the unit box, mapped onto the parameter ranges.
+
+    Keeps track of the number of evaluations, the shots they used and the best parameters found so far.
+    Points found in the optional EvaluationCache are not run again (but still count towards the evaluation
+    budget). With adaptive shots, a point stops acquiring once it is statistically worse than the best one.
+    """
+
+    def __init__(self, experiment, pulse_type, bounds, update, max_evaluations, cache=None, seed=None,
+                 adaptive_shots=False, num_shots=NUM_MEASUREMENTS):
+        self.experiment, self.pulse_type = experiment, pulse_type
+        self.cache, self.seed, self.adaptive_shots, self.num_shots = cache, seed, adaptive_shots, num_shots
+        self.shots, self.best_lower = 0, 0.0
+        self.lower, self.upper = np.array(bounds, dtype=float).T
+        self.update, self.max_evaluations = update, max_evaluations
+        self.evaluations = 0
+        self.best_fidelity, self.best_params = -np.inf, None
+
+    @property
+    def dims(self):
+        return len(self.lower)
+
+    @property
+    def exhausted(self):
+        return self.evaluations >= self.max_evaluations
+
+    def __call__(self, x):
+        """Return the fidelity at the unit-box point x (clipped into the box)."""
+        x = np.clip(np.asarray(x, dtype=float), 0.0, 1.0)
+        amp, freq, *beta = self.lower + x * (self.upper - self.lower)
+        params = (self.pulse_type, amp, freq, beta[0] if beta else None)
+
+        fidelity = self._evaluate(params)
+        self.evaluations += 1
+        self.update(1)
+        if fidelity > self.best_fidelity:
+            self.best_fidelity, self.best_params = fidelity, params
+        return fidelity
+
+    def _evaluate(self, params):
+        """Return the fidelity of a parameter point, from the cache if it has been evaluated before."""
+        if self.adaptive_shots:  # Shot counts vary, so these evaluations are not cached
+            result = self.experiment.run_adaptive([params], best_fidelity=self.best_lower,
+                                                  max_shots=self.num_shots)[0]
+            self.shots += result['shots']
+            self.best_lower = max(self.best_lower, result['fidelity_low'])
+            return result['fidelity']
+
+        key = evaluation_key(self.experiment, params, self.num_shots, self.seed) if self.cache else None
+        evaluation = self.cache.get(key) if self.cache else None
+        if evaluation is None:
+            result = self.experiment.run(*params, num_shots=self.num_shots)
+            self.shots += self.num_shots
+            if self.cache:
+                self.cache.put(key, cache_entry(result))
+            return result['fidelity']
+        return evaluation['fidelity']
+
+
+def _nelder_mead(objective, rng, initial_step=0.25, tolerance=1e-3):
+    """Maximize the objective with the Nelder-Mead simplex method."""
+    simplex = [np.full(objective.dims, 0.5)]
+    simplex += [simplex[0] + initial_step * np.eye(objective.dims)[i] for i in range(objective.dims)]
+    values = [objective(x) for x in simplex]
+
+    while not objective.exhausted:
+        order = np.argsort(values)[::-1]  # Best (highest fidelity) first
+        simplex, values = [simplex[i] for i in order], [values[i] for i in order]
+        if max(np.max(np.abs(x - simplex[0])) for x in simplex[1:]) < tolerance:
+            break
+
+        centroid = np.mean(simplex[:-1], axis=0)
+        reflected = np.clip(2 * centroid - simplex[-1], 0.0, 1.0)
+        reflected_value = objective(reflected)
+
+        if reflected_value > values[0] and not objective.exhausted:  # Expand further in the same direction
+            expanded = np.clip(3 * centroid - 2 * simplex[-1], 0.0, 1.0)
+            expanded_value = objective(expanded)
+            simplex[-1], values[-1] = ((expanded, expanded_value) if expanded_value > reflected_value
+                                       else (reflected, reflected_value))
+        elif reflected_value > values[-2]:
+            simplex[-1], values[-1] = reflected, reflected_value
+        elif not objective.exhausted:  # Contract towards the centroid, or shrink towards the best point
+            contracted = (centroid + simplex[-1]) / 2
+            contracted_value = objective(contracted)
+            if contracted_value > values[-1]:
+                simplex[-1], values[-1] = contracted, contracted_value
+            else:
+                for i in range(1, len(simplex)):
+                    if objective.exhausted:
+                        break
+                    simplex[i] = (simplex[0] + simplex[i]) / 2
+                    values[i] = objective(simplex[i])
+
+
+def _golden_section(objective, rng, tolerance=1e-2):
+    """
+    Maximize the objective by cyclic coordinate refinement, with a golden-section search per coordinate.
+
+    Every sweep over the coordinates halves the search interval around the current best point.
+    """
+    best = np.full(objective.dims, 0.5)
+    half_width = 0.5
+
+    while not objective.exhausted and half_width > tolerance:
+        for dim in range(objective.dims):
+            low, high = max(best[dim] - half_width, 0.0), min(best[dim] + half_width, 1.0)
+
+            def line(t):
+                x = best.copy()
+                x[dim] = t
+                return objective(x)
+
+            inner_low, inner_high = high - GOLDEN_RATIO * (high - low), low + GOLDEN_RATIO * (high - low)
+            value_low, value_high = line(inner_low), line(inner_high)
+            while high - low > tolerance and not objective.exhausted:
+                if value_low > value_high:
+                    high, inner_high, value_high = inner_high, inner_low, value_low
+                    inner_low = high - GOLDEN_RATIO * (high - low)
+                    value_low = line(inner_low)
+                else:
+                    low, inner_low, value_low = inner_low, inner_high, value_high
+                    inner_high = low + GOLDEN_RATIO * (high - low)
+                    value_high = line(inner_high)
+
+            best[dim] = inner_low if value_low > value_high else inner_high
+            if objective.exhausted:
+                return
+        half_width /= 2
+
+
+def _bayesian(objective, rng, length_scale=0.2, noise=1e-3, num_candidates=2048):
+    """
+    Maximize the objective with Gaussian-process Bayesian optimization.
+
+    Uses a squared-exponential kernel on the unit box and picks each new point by expected improvement
+    over a random candidate set.
+    """
+    def kernel(a, b):
+        return np.exp(-np.sum((a[:, None, :] - b[None, :, :]) ** 2, axis=-1) / (2 * length_scale ** 2))
 
-    # Going over all possible parameters to find the best combination for optimal fidelity
-    with tqdm(total=total_iterations, desc="Grid Search Progress", file=sys.stdout) as pbar:
+    samples = list(rng.random((2 * objective.dims + 1, objective.dims)))
+    values = [objective(x) for x in samples[:objective.max_evaluations]]
+
+    while not objective.exhausted:
+        x_seen = np.array(samples)
+        y_seen = np.array(values)
+        y_mean, y_std = y_seen.mean(), y_seen.std() or 1.0
+        y_normalized = (y_seen - y_mean) / y_std
+
+        cholesky = np.linalg.cholesky(kernel(x_seen, x_seen) + noise * np.eye(len(x_seen)))
+        alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, y_normalized))
+
+        candidates = rng.random((num_candidates, objective.dims))
+        cross = kernel(candidates, x_seen)
+        mean = cross @ alpha
+        variance = np.clip(1.0 - np.sum(np.linalg.solve(cholesky, cross.T) ** 2, axis=0), 1e-12, None)
+        std = np.sqrt(variance)
+
+        # Expected improvement over the best observed value
+        z = (mean - y_normalized.max()) / std
+        cdf = 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+        pdf = np.exp(-z ** 2 / 2) / math.sqrt(2 * math.pi)
+        next_x = candidates[np.argmax((mean - y_normalized.max()) * cdf + std * pdf)]
+
+        samples.append(next_x)
+        values.append(objective(next_x))
+
+
+# Adaptive optimization strategies, each maximizing an _Objective until its evaluation budget is exhausted
+OPTIMIZERS = {
+    "nelder_mead": _nelder_mead,
+    "golden": _golden_section,
+    "bayesian": _bayesian,
+}
+
+
+def basic_optimization(pulse_types, amplitude_range, frequency_range, steps=5, seed=None,
+                       discriminator=DEFAULT_DISCRIMINATOR, experiment=None, method="grid",
+                       max_evaluations=OPTIMIZER_MAX_EVALUATIONS, workers=1, cache=None, adaptive_shots=False,
+                       progress=None, num_shots=NUM_MEASUREMENTS):
+    """
+    Find the readout parameters with the best fidelity.
+
+    The default "grid" method is an exhaustive grid search with the given number of steps per parameter.
+    The adaptive methods in OPTIMIZERS use at most max_evaluations experiment runs per pulse shape.
+    The grid search can be spread over a pool of worker processes, with results independent of their number.
+    With an EvaluationCache, points evaluated by earlier (possibly interrupted) runs are not run again.
+    With adaptive_shots, every point acquires shots in batches and stops early once it is statistically
+    worse than the best point or its fidelity is known precisely enough; these runs bypass the cache and
+    the worker pool. Every point is measured with num_shots shots per state (at most, with adaptive_shots).
+    The result reports the number of shots per state that were used.
+    An existing Experiment can be passed in to reuse its connected session and compiled experiments.
+    Progress is shown on the console, or reported as progress(count, total) if a callback is given.
+    """
+    # Only the fidelities are used, so the experiment does not need to keep the shots
+    experiment = experiment or Experiment(seed=seed, discriminator=discriminator, summary_only=True)
+    if method != "grid":
+        return _adaptive_optimization(experiment, pulse_types, amplitude_range, frequency_range, method,
+                                      max_evaluations, cache, seed, adaptive_shots, progress, num_shots)
+
+    best_fidelity = 0
+    best_params = None
+    shots = 0
+
+    points = grid_points(pulse_types, amplitude_range, frequency_range, steps)
+    if adaptive_shots:
+        return _sequential_grid_search(experiment, points, progress, num_shots)
+
+    # Going over all possible parameters to find the best combination for optimal fidelity.
+    # Points are evaluated in batches, so that simulation mode handles each batch in one vectorized pass.
+    with _progress(len(points), "Grid Search Progress", progress) as update:
+        results = evaluate_points(experiment, points, workers, seed, num_shots, progress=update, cache=cache)
+        for params, result in zip(points, results):
+            shots += 0 if result.get('cached') else num_shots
+            if result['fidelity'] > best_fidelity:
+                best_fidelity = result['fidelity']
+                best_params = params
+
+    return _best_result(best_params, best_fidelity, len(points), shots)
+
+
+def _sequential_grid_search(experiment, points, progress=None, num_shots=NUM_MEASUREMENTS):
+    """Grid search with sequential measurement, pruning points that are statistically worse than the best."""
+    best_fidelity, best_params, best_lower, shots = 0, None, 0.0, 0
+
+    with _progress(len(points), "Grid Search Progress", progress) as update:
+        for start in range(0, len(points), SIMULATION_BATCH_SIZE):
+            batch = points[start:start + SIMULATION_BATCH_SIZE]
+            for params, result in zip(batch, experiment.run_adaptive(batch, best_fidelity=best_lower,
+                                                                     max_shots=num_shots)):
+                shots += result['shots']
+                best_lower = max(best_lower, result['fidelity_low'])
+                if result['fidelity'] > best_fidelity:
+                    best_fidelity = result['fidelity']
+                    best_params = params
+            update(len(batch))
+
+    return _best_result(best_params, best_fidelity, len(points), shots)
+
+
+def multiplexed_optimization(pulse_types, qubit_ranges, steps=5, seed=None, discriminator=DEFAULT_DISCRIMINATOR,
+                             experiment=None, progress=None):
+    """
+    Find the best readout parameters of several qubits sharing a feedline with one multiplexed grid search.
+
+    qubit_ranges holds one (amplitude_range, frequency_range) pair per qubit. Every grid point is applied to
+    all qubits at once, each within its own ranges, so the whole chip is calibrated by a single sweep.
+    Each qubit then keeps its own best point (crosstalk is taken into account only as measured).
+    Returns one best result per qubit. Progress is shown or reported as in basic_optimization.
+    """
+    experiment = experiment or Experiment(seed=seed, discriminator=discriminator, num_qubits=len(qubit_ranges),
+                                          summary_only=True)
+    qubit_points = [grid_points(pulse_types, amp_range, freq_range, steps) for amp_range, freq_range in qubit_ranges]
+    points = list(zip(*qubit_points))
+
+    best_fidelities, best_params = [0] * len(qubit_ranges), [None] * len(qubit_ranges)
+    with _progress(len(points), "Multiplexed Grid Search Progress", progress) as update:
+        for start in range(0, len(points), SIMULATION_BATCH_SIZE):
+            batch = points[start:start + SIMULATION_BATCH_SIZE]
+            for point, results in zip(batch, experiment.run_multiplexed(batch)):
+                for qubit, result in enumerate(results):
+                    if result['fidelity'] > best_fidelities[qubit]:
+                        best_fidelities[qubit], best_params[qubit] = result['fidelity'], point[qubit]
+            update(len(batch))
+
+    # All qubits share the shots of every point
+    return [dict(_best_result(params, fidelity, len(points), len(points) * NUM_MEASUREMENTS), qubit=qubit)
+            for qubit, (params, fidelity) in enumerate(zip(best_params, best_fidelities))]
+
+
+def _adaptive_optimization(experiment, pulse_types, amplitude_range, frequency_range, method, max_evaluations,
+                           cache=None, seed=None, adaptive_shots=False, progress=None,
+                           num_shots=NUM_MEASUREMENTS):
+    """Optimize every pulse shape with one of the OPTIMIZERS and return the overall best parameters."""
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimization method '{method}'. Must be one of {['grid'] + list(OPTIMIZERS)}")
+
+    best_fidelity, best_params, evaluations, shots = 0, None, 0, 0
+    with _progress(max_evaluations * len(pulse_types), f"{method} Progress", progress) as update:
         for pulse in pulse_types:
-            beta_values = np.linspace(0.1, 1.0, steps) if pulse == "DRAG" else [None]
-            for amp in amp_values:
-                for freq in freq_values:
-                    for beta in beta_values:
-                        result = experiment.run(pulse, amp, freq, beta)
+            bounds = [amplitude_range, frequency_range] + ([BETA_RANGE] if pulse == "DRAG" else [])
+            objective = _Objective(experiment, pulse, bounds, update, max_evaluations, cache, seed, adaptive_shots,
+                                   num_shots)
+            OPTIMIZERS[method](objective, experiment.rng)
+
+            evaluations, shots = evaluations + objective.evaluations, shots + objective.shots
+            if objective.best_fidelity > best_fidelity:
+                best_fidelity, best_params = objective.best_fidelity, objective.best_params
 
-                        if result['fidelity'] > best_fidelity:
-                            best_fidelity = result['fidelity']
-                            best_params = (pulse, amp, freq, beta)
+    return _best_result(best_params, best_fidelity, evaluations, shots)
 
-                        pbar.update(1)  # Update progress bar for each parameter combination
 
+def _best_result(best_params, best_fidelity, evaluations, shots):
+    """Package the best parameters found by an optimization."""
     return {
         "pulse_type": best_params[0],
         "amplitude": best_params[1],
         "frequency": best_params[2],
         "beta": best_params[3] if best_params[0] == "DRAG" else None,  # Include beta only for DRAG
-        "fidelity": best_fidelity
+        "fidelity": best_fidelity,
+        "evaluations": evaluations,
+        "shots": shots  # Shots per state acquired for the evaluations
     }
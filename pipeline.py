@@ -0,0 +1,159 @@
+"""
+This module pipelines experiment execution, overlapping compilation, execution and analysis.
+"""
+
+import queue
+import threading
+import time
+from config import PIPELINE_QUEUE_SIZE
+from profiling import stage
+
+_DONE = object()  # Marks the end of a stage's stream
+
+
+class SimulationBackend:
+    """Execution backend simulating the IQ data of a job with the experiment's simulator."""
+
+    def __init__(self, experiment):
+        self.experiment = experiment
+
+    def compile(self, points, num_shots):
+        """Simulation needs no compilation, the job's points are passed on as they are."""
+        return points
+
+    def execute(self, compiled, num_shots):
+        """Simulate ground and excited state IQ data of shape (points, shots, 2)."""
+        amplitudes = [float(amp) for _, amp, _, _ in compiled]
+        frequencies = [float(freq) for _, _, freq, _ in compiled]
+        with stage("simulate"):
+            return self.experiment._simulate(amplitudes, frequencies, num_shots, self.experiment.rng)
+
+
+class LabOneQBackend:
+    """Execution backend compiling and running jobs through the experiment's LabOneQ session."""
+
+    def __init__(self, experiment):
+        self.experiment = experiment
+
+    def compile(self, points, num_shots):
+        """Compile one sweep experiment for the job's points."""
+        return len(points), self.experiment._compile_points(points, num_shots)
+
+    def execute(self, compiled, num_shots):
+        """Run the compiled sweep on the connected session."""
+        num_points, compiled_experiment = compiled
+        return self.experiment._run_compiled(compiled_experiment, num_points, num_shots)
+
+
+class MockHardwareBackend(SimulationBackend):
+    """
+    Simulation backend with artificial compile and execution latency, standing in for hardware.
+
+    Lets the pipeline be exercised and timed without instruments or LabOneQ.
+    """
+
+    def __init__(self, experiment, compile_latency=0.01, execute_latency=0.05):
+        super().__init__(experiment)
+        self.compile_latency, self.execute_latency = compile_latency, execute_latency
+
+    def compile(self, points, num_shots):
+        time.sleep(self.compile_latency)
+        return super().compile(points, num_shots)
+
+    def execute(self, compiled, num_shots):
+        time.sleep(self.execute_latency)
+        return super().execute(compiled, num_shots)
+
+
+def split_jobs(points, job_size=1):
+    """Split points into jobs of at most job_size consecutive points sharing one pulse shape."""
+    jobs = []
+    for point in points:
+        if jobs and len(jobs[-1]) < job_size and jobs[-1][0][0] == point[0]:
+            jobs[-1].append(point)
+        else:
+            jobs.append([point])
+    return jobs
+
+
+class ExperimentPipeline:
+    """
+    Runs jobs through compile, execute and analyze stages, each on its own thread.
+
+    The stages are connected by bounded queues, so compilation never runs more than queue_size jobs
+    ahead of execution (backpressure). Results stream back in job order as their analysis completes.
+    """
+
+    def __init__(self, backend, analyze, queue_size=PIPELINE_QUEUE_SIZE):
+        self.backend, self.analyze, self.queue_size = backend, analyze, queue_size
+
+    def run(self, points, num_shots, job_size=1):
+        """Yield the results of all points, in order, while later jobs are still compiling and executing."""
+        jobs = split_jobs(points, job_size)
+        compiled_queue, executed_queue, result_queue = (queue.Queue(self.queue_size) for _ in range(3))
+        stop = threading.Event()
+
+        def put(target, item):
+            """Put an item on a bounded queue, giving up once the pipeline is stopped."""
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(source):
+            """Get the next item from a queue, or _DONE once the pipeline is stopped."""
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def run_stage(source, target, work):
+            """Apply work to every item of source (or of the jobs if source is None) and pass it on."""
+            try:
+                items = iter(jobs) if source is None else iter(lambda: get(source), _DONE)
+                for item in items:
+                    if isinstance(item, Exception):  # An earlier stage failed
+                        put(target, item)
+                        return
+                    if not put(target, work(item)):
+                        return
+                put(target, _DONE)
+            except Exception as e:  # Forward the error to the consumer, which raises it
+                put(target, e)
+
+        def compile_job(job):
+            with stage("pipeline_compile"):
+                return job, self.backend.compile(job, num_shots)
+
+        def execute_job(item):
+            job, compiled = item
+            with stage("pipeline_execute"):
+                return job, self.backend.execute(compiled, num_shots)
+
+        def analyze_job(item):
+            job, (iq_data_0, iq_data_1) = item
+            with stage("pipeline_analyze"):
+                return self.analyze(job, iq_data_0, iq_data_1)
+
+        threads = [threading.Thread(target=run_stage, args=args, daemon=True) for args in (
+            (None, compiled_queue, compile_job),
+            (compiled_queue, executed_queue, execute_job),
+            (executed_queue, result_queue, analyze_job),
+        )]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for results in iter(lambda: get(result_queue), _DONE):
+                if isinstance(results, Exception):
+                    raise results
+                yield from results
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,208 @@
+"""
+This module handles plotting of IQ results, interactively or to image files.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import DENSITY_SHOT_THRESHOLD
+from profiling import stage
+
+TILE_SIZE = (5, 3)  # inches per subplot
+TILE_DPI = 100
+DENSITY_BINS = 60  # histogram bins per axis for density plots
+PAGE_TILES = 32  # tiles per page of sweep plots
+PAGE_COLUMNS = 8  # most tiles per row of sweep plots
+SWEEP_LABELS = {"pulse_type": "Pulse Shapes"}  # titles of swept axes, other than their capitalized names
+SHORT_AXIS_NAMES = {"amplitude": "A", "frequency": "f", "beta": "β", "length": "L"}
+
+
+def index_results(results, sweep_param):
+    """Indexes results by (pulse type, sweep parameter value), skipping failed runs."""
+    return {(result["pulse_type"], result[sweep_param]): result for result in results if result is not None}
+
+
+def draw_iq(ax, result, title, density_threshold=DENSITY_SHOT_THRESHOLD):
+    """
+    Draws the IQ data of a single result, as a scatter plot or as a density plot for many shots.
+
+    Summary-only results have no shots, so each state is drawn as its mean and 2-sigma covariance ellipse.
+    """
+    if "iq_data_0" not in result:
+        _draw_iq_statistics(ax, result)
+    else:
+        _draw_iq_shots(ax, result, density_threshold)
+
+    ax.set_title(title)
+    ax.set_xlabel("I")
+    ax.set_ylabel("Q")
+    ax.legend()
+    ax.grid()
+
+
+def _draw_iq_statistics(ax, result):
+    """Draws the mean and 2-sigma covariance ellipse of both states."""
+    circle = np.stack([np.cos(np.linspace(0, 2 * np.pi, 64)), np.sin(np.linspace(0, 2 * np.pi, 64))])
+    for state, color in (("0", "blue"), ("1", "red")):
+        mean, covariance = np.asarray(result[f"mean_{state}"]), np.asarray(result[f"cov_{state}"])
+        ellipse = mean[:, None] + 2 * np.linalg.cholesky(covariance + 1e-12 * np.eye(2)) @ circle
+        ax.fill(ellipse[0], ellipse[1], color=color, alpha=0.3, label=f"|{state}⟩")
+        ax.plot(mean[0], mean[1], "+", color=color)
+
+
+def _draw_iq_shots(ax, result, density_threshold):
+    """Draws the single shots of both states, or their density above density_threshold shots."""
+    iq_data_0, iq_data_1 = np.asarray(result["iq_data_0"]), np.asarray(result["iq_data_1"])
+
+    if max(len(iq_data_0), len(iq_data_1)) > density_threshold:  # Per-shot scatter becomes slow and unreadable
+        # Draw both states as one 2D-histogram image: |0> density in blue, |1> density in red
+        lower, upper = np.min([iq_data_0.min(axis=0), iq_data_1.min(axis=0)], axis=0), \
+            np.max([iq_data_0.max(axis=0), iq_data_1.max(axis=0)], axis=0)
+        bins = [np.linspace(lower[dim], upper[dim], DENSITY_BINS + 1) for dim in range(2)]
+        image = np.ones((DENSITY_BINS, DENSITY_BINS, 3))
+        for data, fade in ((iq_data_0, [1.0, 1.0, 0.0]), (iq_data_1, [0.0, 1.0, 1.0])):
+            counts = np.histogram2d(data[:, 0], data[:, 1], bins=bins)[0].T
+            image -= np.sqrt(counts / max(counts.max(), 1))[..., None] * np.array(fade)
+        ax.imshow(np.clip(image, 0, 1), origin="lower", aspect="auto", interpolation="nearest",
+                  extent=(lower[0], upper[0], lower[1], upper[1]))
+        ax.plot([], [], "s", color="blue", label="|0⟩")
+        ax.plot([], [], "s", color="red", label="|1⟩")
+    else:
+        ax.scatter(iq_data_0[:, 0], iq_data_0[:, 1], color="blue", alpha=0.5, label="|0⟩")
+        ax.scatter(iq_data_1[:, 0], iq_data_1[:, 1], color="red", alpha=0.5, label="|1⟩")
+
+
+def _tile_title(result, pulse, sweep_param, param):
+    return f"{pulse}, {sweep_param.capitalize()}={param:.2f}\nFidelity: {result['fidelity']:.3f}"
+
+
+def _render_tile(result, title, density_threshold):
+    """Renders a single subplot off-screen and returns it as an RGBA image array."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=TILE_SIZE, dpi=TILE_DPI)
+    canvas = FigureCanvasAgg(fig)
+    if result is not None:
+        draw_iq(fig.add_subplot(), result, title, density_threshold)
+        fig.subplots_adjust(left=0.15, right=0.97, bottom=0.16, top=0.82)  # Fixed margins, tight_layout is slow
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def _render_banner(text, width):
+    """Renders a title banner of the given pixel width as an RGBA image array."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(width / TILE_DPI, 0.5), dpi=TILE_DPI)
+    canvas = FigureCanvasAgg(fig)
+    fig.text(0.5, 0.5, text, ha="center", va="center", fontsize=14)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[:, :width].copy()
+
+
+def plot_iq_results(results, mode, sweep_param, output=None, output_format="png", workers=1,
+                    density_threshold=DENSITY_SHOT_THRESHOLD):
+    """Plots IQ results, timed as the 'plot' profiling stage."""
+    with stage("plot"):
+        return _plot_iq_results(results, mode, sweep_param, output, output_format, workers, density_threshold)
+
+
+def _plot_iq_results(results, mode, sweep_param, output, output_format, workers, density_threshold):
+    """Plots IQ results for both single and range modes, as a grid of pulse shapes by sweep parameter values."""
+    indexed = index_results(results, sweep_param)
+    pulse_shapes = sorted(set(pulse for pulse, _ in indexed))
+    param_values = sorted(set(param for _, param in indexed))
+    grid = [[(indexed.get((pulse, param)), _tile_title(indexed[(pulse, param)], pulse, sweep_param, param)
+              if (pulse, param) in indexed else "") for param in param_values] for pulse in pulse_shapes]
+    suptitle = f"IQ Response for Pulse Shapes & {sweep_param.capitalize()} Sweep"
+    return _plot_grid(grid, suptitle, output, output_format, workers, density_threshold)
+
+
+def plot_sweep_page(results, page, swept, columns, output=None, output_format="png", workers=1,
+                    density_threshold=DENSITY_SHOT_THRESHOLD):
+    """
+    Plots one chunk of sweep results as a page of tiles, timed as the 'plot' profiling stage.
+
+    Tiles are laid out in rows of the given number of columns and titled with the values of the swept
+    axes. Pages after the first are written to '<output>_<page + 1>.<output_format>', so every chunk of a
+    long sweep can be inspected while the rest is still running.
+    """
+    with stage("plot"):
+        tiles = [(result, _sweep_tile_title(result, swept) if result is not None else "") for result in results]
+        grid = [tiles[start:start + columns] for start in range(0, len(tiles), columns)]
+        grid[-1] += [(None, "")] * (columns - len(grid[-1]))
+        labels = [SWEEP_LABELS.get(axis, axis.capitalize()) for axis in swept]
+        suptitle = f"IQ Response for {' & '.join(labels) or 'Single Point'} Sweep" + (f" ({page + 1})" if page else "")
+        if output is not None and page:
+            output = f"{output}_{page + 1}"
+        return _plot_grid(grid, suptitle, output, output_format, workers, density_threshold)
+
+
+def _sweep_tile_title(result, swept):
+    axes = [axis for axis in swept if axis != "pulse_type" and result.get(axis) is not None]
+    parameters = ""
+    for axis in axes:  # Short names once several parameters share a title
+        name = axis.capitalize() if len(axes) == 1 else SHORT_AXIS_NAMES[axis]
+        value = f"{result[axis] * 1e9:g}ns" if axis == "length" else f"{result[axis]:.2f}"
+        parameters += f", {name}={value}"
+    return f"{result['pulse_type']}{parameters}\nFidelity: {result['fidelity']:.3f}"
+
+
+def _plot_grid(grid, suptitle, output, output_format, workers, density_threshold):
+    """
+    Draws rows of (result, title) tiles, skipping empty (None) tiles.
+
+    Without an output path the figure is shown interactively. Otherwise it is written headlessly to
+    '<output>.<output_format>': PNG overviews are assembled from tiles rendered on a pool of worker
+    processes, SVG overviews are drawn as a single vector figure. Returns None if there is nothing to plot.
+    """
+    if not any(result is not None for row in grid for result, _ in row):  # Every run failed
+        print("No results to plot.")
+        return None
+
+    num_rows, num_cols = len(grid), len(grid[0])
+
+    if output is not None and output_format == "png":
+        tiles, titles = zip(*(cell for row in grid for cell in row))
+        thresholds = [density_threshold] * len(tiles)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                images = list(pool.map(_render_tile, tiles, titles, thresholds))
+        else:
+            images = list(map(_render_tile, tiles, titles, thresholds))
+
+        from matplotlib.image import imsave
+        rows = [np.concatenate(images[row * num_cols:(row + 1) * num_cols], axis=1) for row in range(num_rows)]
+        overview = np.concatenate([_render_banner(suptitle, rows[0].shape[1])] + rows, axis=0)
+        filename = f"{output}.png"
+        imsave(filename, overview)
+        print(f"Plot saved to {filename}")
+        return filename
+
+    figsize = (max(15, TILE_SIZE[0] * num_cols), num_rows * TILE_SIZE[1])
+    if output is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=figsize)
+    else:  # Headless vector output, without pyplot or a display
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=figsize)
+
+    axes = fig.subplots(num_rows, num_cols, squeeze=False)
+    for row_idx, row in enumerate(grid):
+        for col_idx, (result, title) in enumerate(row):
+            if result is None:
+                axes[row_idx, col_idx].set_axis_off()
+                continue
+            draw_iq(axes[row_idx, col_idx], result, title, density_threshold)
+
+    fig.suptitle(suptitle)
+    fig.tight_layout()
+    if output is None:
+        plt.show()
+        return None
+
+    filename = f"{output}.{output_format}"
+    fig.savefig(filename, format=output_format)
+    print(f"Plot saved to {filename}")
+    return filename
@@ -0,0 +1,96 @@
+"""
+This module provides lightweight per-stage timing instrumentation.
+
+Code marks its stages with `with stage("name"):`. While profiling is disabled this returns a shared
+no-op context manager, so the hooks cost next to nothing. Once enabled, the duration and count of every
+stage are collected, and can be printed as a summary or written as a Chrome trace (chrome://tracing,
+Perfetto) timeline.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+_enabled = False
+_totals = defaultdict(lambda: [0, 0.0])  # stage name -> [count, total seconds]
+_events = []  # Chrome trace "complete" events
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _NoOpStage:
+    """Context manager used while profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _TimedStage:
+    """Context manager recording the duration of one stage execution."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        with _lock:
+            totals = _totals[self.name]
+            totals[0] += 1
+            totals[1] += end - self.start
+            _events.append({"name": self.name, "ph": "X", "ts": (self.start - _origin) * 1e6,
+                            "dur": (end - self.start) * 1e6, "pid": os.getpid(), "tid": threading.get_ident()})
+        return False
+
+
+_NO_OP_STAGE = _NoOpStage()
+
+
+def stage(name):
+    """Returns a context manager timing the named stage (a no-op while profiling is disabled)."""
+    return _TimedStage(name) if _enabled else _NO_OP_STAGE
+
+
+def enable():
+    """Starts collecting stage timings."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stops collecting stage timings."""
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Discards all collected timings."""
+    with _lock:
+        _totals.clear()
+        _events.clear()
+
+
+def summary():
+    """Returns a table of the count, total and mean duration of every stage."""
+    with _lock:
+        rows = sorted(_totals.items(), key=lambda item: item[1][1], reverse=True)
+    lines = [f"{'Stage':<20}{'Count':>10}{'Total [s]':>14}{'Mean [ms]':>14}"]
+    lines += [f"{name:<20}{count:>10}{total:>14.4f}{1e3 * total / count:>14.4f}" for name, (count, total) in rows]
+    return "\n".join(lines)
+
+
+def write_trace(path):
+    """Writes the collected stage executions as a Chrome trace JSON file."""
+    with _lock:
+        trace = {"traceEvents": list(_events), "displayTimeUnit": "ms"}
+    with open(path, "w") as f:
+        json.dump(trace, f)
+    return path
@@ -0,0 +1,122 @@
+"""
+This module defines the compact in-memory representation of experiment results.
+"""
+
+import numpy as np
+
+
+def iq_statistics(iq_data_0, iq_data_1):
+    """Returns the sufficient IQ statistics (means, covariances and shot counts) of both states."""
+    statistics = {}
+    for state, data in (("0", np.asarray(iq_data_0)), ("1", np.asarray(iq_data_1))):
+        statistics[f"mean_{state}"] = data.mean(axis=0).tolist()
+        statistics[f"cov_{state}"] = np.cov(data, rowvar=False).tolist()
+        statistics[f"shots_{state}"] = len(data)
+    return statistics
+
+
+def batch_statistics(iq_data_0, iq_data_1):
+    """Returns the iq_statistics of every point of IQ data stacked as (points, shots, 2), in one vectorized pass."""
+    columns = {}
+    for state, data in (("0", np.asarray(iq_data_0, dtype=float)), ("1", np.asarray(iq_data_1, dtype=float))):
+        means = data.mean(axis=1)
+        centered = data - means[:, None]
+        columns[f"mean_{state}"] = means.tolist()
+        columns[f"cov_{state}"] = (centered.transpose(0, 2, 1) @ centered / max(data.shape[1] - 1, 1)).tolist()
+        columns[f"shots_{state}"] = [data.shape[1]] * data.shape[0]
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class ReadoutResult:
+    """
+    Result of a single parameter point.
+
+    The IQ shots are kept as float32 (shots, 2) arrays, views into the contiguous buffer of the batch they
+    were measured in, rather than as Python lists. A summary-only result keeps no shots, only the sufficient
+    statistics of both states (means, covariances and shot counts) and the fidelity.
+    Results are read like the result dictionaries they replace: result["fidelity"], result.get("shots"),
+    "iq_data_0" in result (true only if the shots were kept). Extra keys are stored with update().
+    """
+
+    __slots__ = ("pulse_type", "amplitude", "frequency", "beta", "fidelity", "iq_data_0", "iq_data_1",
+                 "_statistics", "_extra")
+
+    FIELDS = ("pulse_type", "amplitude", "frequency", "beta", "fidelity", "iq_data_0", "iq_data_1")
+    STATISTICS = ("mean_0", "cov_0", "shots_0", "mean_1", "cov_1", "shots_1")
+
+    def __init__(self, pulse_type, amplitude, frequency, fidelity, iq_data_0=None, iq_data_1=None, beta=None,
+                 statistics=None, **extra):
+        self.pulse_type, self.amplitude, self.frequency, self.beta = pulse_type, amplitude, frequency, beta
+        self.fidelity = float(fidelity)
+        self.iq_data_0, self.iq_data_1 = iq_data_0, iq_data_1
+        self._statistics = statistics  # Computed from the shots on first use if they are kept
+        self._extra = extra or None
+
+    def __repr__(self):
+        shots = "summary" if self.iq_data_0 is None else f"{len(self.iq_data_0)} shots"
+        return (f"ReadoutResult({self.pulse_type}, amplitude={self.amplitude}, frequency={self.frequency}, "
+                f"fidelity={self.fidelity:.3f}, {shots})")
+
+    @property
+    def summary_only(self):
+        """Whether only the sufficient statistics of the shots are kept."""
+        return self.iq_data_0 is None
+
+    def statistics(self):
+        """Returns the sufficient IQ statistics (means, covariances and shot counts) of both states."""
+        if self._statistics is None:
+            self._statistics = iq_statistics(self.iq_data_0, self.iq_data_1)
+        return self._statistics
+
+    def keys(self):
+        """Returns the keys that hold a value, in the order of the result dictionaries."""
+        keys = [key for key in self.FIELDS if getattr(self, key) is not None]
+        if self.summary_only:
+            keys += self.STATISTICS
+        return keys + list(self._extra or ())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key in self.FIELDS and getattr(self, key) is not None:
+            return getattr(self, key)
+        if key in self.STATISTICS and self.summary_only:
+            return self.statistics()[key]
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, **extra):
+        """Stores extra keys, such as the shots used by adaptive runs or the qubit of multiplexed runs."""
+        self._extra = {**(self._extra or {}), **extra}
+
+    def to_dict(self):
+        """Converts the result into a plain dictionary with lists instead of arrays, e.g. for JSON output."""
+        return {key: value.tolist() if isinstance(value, np.ndarray) else value
+                for key, value in ((key, self[key]) for key in self.keys())}
+
+
+def build_results(points, iq_data_0, iq_data_1, fidelities, summary_only=False):
+    """
+    Builds the ReadoutResults of a batch of (pulse_type, amplitude, frequency, beta) points.
+
+    The IQ data of each state is stacked as (points, shots, 2) and converted to float32 once, so every
+    result only holds views into that buffer. With summary_only the shots are dropped and only their
+    statistics are kept.
+    """
+    if summary_only:
+        return [ReadoutResult(pulse_type, amp, freq, fidelity, beta=beta, statistics=statistics)
+                for (pulse_type, amp, freq, beta), fidelity, statistics
+                in zip(points, fidelities, batch_statistics(iq_data_0, iq_data_1))]
+
+    iq_data_0 = np.asarray(iq_data_0, dtype=np.float32)
+    iq_data_1 = np.asarray(iq_data_1, dtype=np.float32)
+    return [ReadoutResult(pulse_type, amp, freq, fidelity, iq_data_0[idx], iq_data_1[idx], beta=beta)
+            for idx, ((pulse_type, amp, freq, beta), fidelity) in enumerate(zip(points, fidelities))]
@@ -0,0 +1,106 @@
+"""
+This module handles N-dimensional parameter sweeps, evaluated lazily in chunks.
+"""
+
+from itertools import groupby, islice, product
+import numpy as np
+from config import NUM_MEASUREMENTS, SIMULATION_BATCH_SIZE
+from executor import evaluate_points
+
+# Sweepable parameters, outermost first in a Cartesian product. The readout length is outermost,
+# so the experiment switches its pulses as rarely as possible.
+SWEEP_AXES = ("length", "pulse_type", "amplitude", "frequency", "beta")
+
+
+class Sweep:
+    """
+    A sweep over any of the SWEEP_AXES, as a Cartesian product or zipped axis by axis.
+
+    Every axis is a sequence of values. When zipped, the numeric axes are stepped through together, once
+    for every pulse type; they must have the same number of values, except for single values, which are
+    used for every point. Unset axes keep the experiment's readout length and the default DRAG beta.
+    Points are generated lazily, so sweeps of any size take no memory up front.
+    """
+
+    def __init__(self, zipped=False, **axes):
+        unknown = set(axes) - set(SWEEP_AXES)
+        if unknown:
+            raise ValueError(f"Unknown sweep axes {sorted(unknown)}. Must be among {list(SWEEP_AXES)}")
+        for axis in ("pulse_type", "amplitude", "frequency"):
+            if not len(axes.get(axis, ())):
+                raise ValueError(f"A sweep needs at least one {axis} value.")
+
+        self.zipped = zipped
+        self.axes = {axis: list(axes.get(axis, [None])) for axis in SWEEP_AXES}
+        if any(length is not None and length <= 0 for length in self.axes["length"]):
+            raise ValueError("Readout lengths must be positive.")
+        sizes = {len(values) for axis, values in self.axes.items() if axis != "pulse_type"} - {1}
+        if zipped and len(sizes) > 1:
+            raise ValueError("Zipped sweep axes must have the same number of values (or a single value).")
+
+    @property
+    def swept(self):
+        """Names of the axes with more than one value."""
+        return [axis for axis, values in self.axes.items() if len(values) > 1]
+
+    @property
+    def columns(self):
+        """Points per row when laying out results: the zipped points, or a product's innermost swept axis."""
+        if self.zipped:
+            return self._zipped_size
+        swept = self.swept
+        return len(self.axes[swept[-1]]) if swept else 1
+
+    @property
+    def _zipped_size(self):
+        return max(len(values) for axis, values in self.axes.items() if axis != "pulse_type")
+
+    def __len__(self):
+        if self.zipped:
+            return len(self.axes["pulse_type"]) * self._zipped_size
+        betas = len(self.axes["beta"])
+        pulse_points = sum(betas if pulse_type == "DRAG" else 1 for pulse_type in self.axes["pulse_type"])
+        return pulse_points * int(np.prod([len(self.axes[axis]) for axis in ("length", "amplitude", "frequency")]))
+
+    def __iter__(self):
+        """Yield (length, (pulse_type, amplitude, frequency, beta)) for every point of the sweep."""
+        if self.zipped:
+            size = self._zipped_size
+            numeric = [values * size if len(values) == 1 else values for axis, values in self.axes.items()
+                       if axis != "pulse_type"]
+            values = ((length, pulse_type, *rest) for pulse_type in self.axes["pulse_type"]
+                      for length, *rest in zip(*numeric))
+        else:
+            values = product(*self.axes.values())
+        for length, pulse_type, amplitude, frequency, beta in values:
+            # Beta only applies to DRAG pulses, other pulse shapes are not repeated for every beta
+            if beta is not None and pulse_type != "DRAG":
+                if not self.zipped and beta != self.axes["beta"][0]:
+                    continue
+                beta = None
+            yield length, (pulse_type, amplitude, frequency, beta)
+
+
+def run_sweep(experiment, sweep, workers=1, seed=None, num_shots=NUM_MEASUREMENTS, chunk_size=SIMULATION_BATCH_SIZE):
+    """
+    Evaluate a Sweep and yield its results in chunks of at most chunk_size, in sweep order.
+
+    Points are generated and evaluated lazily (see evaluate_points), so only the chunks being evaluated
+    or consumed are held in memory. Each readout length is run as one group on the experiment, with its
+    own random stream spawned from the seed. Results carry the readout length if it is swept.
+    """
+    seed_root = np.random.SeedSequence(seed)
+    readout_length = experiment.readout_length
+    try:
+        for length, group in groupby(sweep, key=lambda point: point[0]):
+            experiment.readout_length = readout_length if length is None else length
+            results = evaluate_points(experiment, (point for _, point in group), workers, seed_root.spawn(1)[0],
+                                      num_shots, chunk_size=chunk_size)
+            for chunk in iter(lambda: list(islice(results, chunk_size)), []):
+                if "length" in sweep.swept:
+                    for result in chunk:
+                        if result is not None:
+                            result.update(length=length)
+                yield chunk
+    finally:
+        experiment.readout_length = readout_length
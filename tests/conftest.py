@@ -0,0 +1,12 @@
+"""
+Pytest configuration for the correctness tests.
+
+The tests run in simulation mode, the LabOneQ tests in emulation mode (skipped without LabOneQ), so no
+instruments are needed:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,128 @@
+"""
+Tests of the calibration daemon, served on a temporary socket with simulated jobs.
+"""
+
+import json
+import os
+import queue
+import threading
+import pytest
+from daemon import CalibrationServer, request
+from client import run_job
+from main import build_parser, parse_job
+from config import RESULTS_DIR
+
+
+def make_job(*argv):
+    """Returns the run_experiment arguments of a quick simulated single point job."""
+    _, job = parse_job(build_parser(), ["--mode", "manual", "--manual_mode", "single", "--pulse", "Square",
+                                        "--amplitude", "0.5", "--frequency", "6.5", "--seed", "0", *argv])
+    return job
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Saved results go to the working directory
+    return str(tmp_path / "daemon.sock")
+
+
+@pytest.fixture
+def start_daemon(socket_path):
+    """Starts a daemon serving on its own thread, returning the server and the thread. Stops it afterwards."""
+    daemons = []
+
+    def start(concurrency=1, server=None):
+        server = server or CalibrationServer(socket_path, concurrency)
+        thread = threading.Thread(target=server.serve)
+        thread.start()
+        daemons.append((server, thread))
+        return server, thread
+
+    yield start
+    for server, thread in daemons:
+        if thread.is_alive():
+            server.shutdown()
+            thread.join()
+
+
+def test_job_messages_are_streamed(socket_path, start_daemon):
+    start_daemon()
+    messages = list(run_job(make_job("--save"), socket_path=socket_path))
+
+    assert [message["type"] for message in messages if message["type"] != "log"] == \
+           ["queued", "started", "progress", "results", "done"]
+    assert {message["job"] for message in messages if "job" in message} == {1}
+    progress = next(message for message in messages if message["type"] == "progress")
+    assert (progress["done"], progress["total"]) == (1, 1)
+    [result] = next(message for message in messages if message["type"] == "results")["results"]
+    assert (result["pulse_type"], result["amplitude"]) == ("Square", 0.5) and "iq_data_0" not in result
+    assert any(message["message"].startswith("Results saved to") for message in messages if message["type"] == "log")
+
+
+def test_jobs_run_by_priority(socket_path, start_daemon):
+    server = CalibrationServer(socket_path, concurrency=1)
+    started, finished = [], queue.Queue()
+
+    def emit(message):
+        if message["type"] == "started":
+            started.append(message["job"])
+        elif message["type"] in ("done", "error"):
+            finished.put(message)
+
+    # Queued before the worker starts, so the queue holds all of them when the first job is picked
+    job_ids = {priority: server.submit(make_job(), priority, emit) for priority in (0, 5, 1)}
+    start_daemon(server=server)
+    assert [finished.get(timeout=30)["type"] for _ in job_ids] == ["done"] * len(job_ids)
+    assert started == [job_ids[5], job_ids[1], job_ids[0]]
+
+
+def test_failed_job_reports_error(socket_path, start_daemon):
+    start_daemon()
+    messages = list(run_job({"mode": "manual", "unknown_setting": 1}, socket_path=socket_path))
+    assert messages[-1]["type"] == "error" and messages[-1]["error"].startswith("Job 1 failed")
+
+    # The daemon keeps serving after a failed job
+    assert list(run_job(make_job(), socket_path=socket_path))[-1]["type"] == "done"
+
+
+def test_invalid_requests_are_rejected(socket_path, start_daemon):
+    server, _ = start_daemon()
+    for message in ({"command": "run", "job": "oops"}, {"command": "run", "job": make_job(), "priority": "high"},
+                    ["run"]):
+        [reply] = request(message, socket_path)
+        assert reply["type"] == "error" and reply["error"].startswith("Invalid request")
+
+    # A job that fails before it runs ends with an error without stopping the only worker
+    errors = queue.Queue()
+    server.submit("oops", 0, errors.put)
+    assert errors.get(timeout=10)["type"] == "error"
+    assert list(run_job(make_job(), socket_path=socket_path))[-1]["type"] == "done"
+    assert server.status()["running"] == {}
+
+
+def test_concurrent_saves_use_separate_files(socket_path, start_daemon):
+    start_daemon(concurrency=2)
+    replies = queue.Queue()
+    clients = [threading.Thread(target=lambda: replies.put(list(run_job(make_job("--save"), socket_path=socket_path))))
+               for _ in range(2)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    assert [replies.get()[-1]["type"] for _ in clients] == ["done", "done"]
+    paths = sorted(os.listdir(RESULTS_DIR))
+    assert len(paths) == 2
+    for path in paths:
+        with open(os.path.join(RESULTS_DIR, path)) as f:
+            assert json.load(f)[0]["pulse_type"] == "Square"
+
+
+def test_status_and_shutdown_remove_socket(socket_path, start_daemon):
+    _, thread = start_daemon(concurrency=2)
+    [status] = request({"command": "status"}, socket_path)
+    assert (status["type"], status["queued"], status["running"], status["concurrency"]) == ("status", 0, {}, 2)
+
+    assert list(request({"command": "shutdown"}, socket_path)) == [{"type": "shutdown"}]
+    thread.join(timeout=10)
+    assert not thread.is_alive() and not os.path.exists(socket_path)
@@ -0,0 +1,57 @@
+"""
+Tests of the results store and writers.
+"""
+
+import os
+from datetime import datetime
+import numpy as np
+import data_handler
+from data_handler import ResultsStore
+from results import ReadoutResult
+
+
+def make_result(amplitude, shots=4):
+    iq_data = np.arange(4 * shots, dtype=np.float32).reshape(2, shots, 2) + amplitude
+    return ReadoutResult("Gaussian", amplitude, 6.5, 0.9, iq_data[0], iq_data[1])
+
+
+def test_results_store_round_trip(tmp_path):
+    results = [make_result(amplitude, shots) for amplitude, shots in ((0.5, 4), (0.6, 7))]
+    with ResultsStore(str(tmp_path / "store"), mode="a") as store:
+        store.extend(results)
+
+    with ResultsStore(str(tmp_path / "store.bin")) as store:
+        assert len(store) == 2
+        for stored, result in zip(store, results):
+            assert stored["amplitude"] == result.amplitude and stored["beta"] is None
+            np.testing.assert_array_equal(stored["iq_data_0"], result.iq_data_0)
+            np.testing.assert_array_equal(stored["iq_data_1"], result.iq_data_1)
+
+
+def test_results_store_recovers_from_interrupted_append(tmp_path):
+    path = str(tmp_path / "store")
+    with ResultsStore(path, mode="a") as store:
+        store.append(make_result(0.5))
+    with open(f"{path}.bin", "ab") as f:  # Shots flushed, but the index row never written
+        f.write(np.ones(10, dtype=np.float32).tobytes())
+
+    with ResultsStore(path, mode="a") as store:
+        store.append(make_result(0.7))
+    with ResultsStore(path) as store:
+        np.testing.assert_array_equal(store[1]["iq_data_0"], make_result(0.7).iq_data_0)
+        np.testing.assert_array_equal(store[1]["iq_data_1"], make_result(0.7).iq_data_1)
+
+
+def test_results_path_is_unique(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    class FrozenClock(datetime):  # Every path is requested at the same instant
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2024, 1, 1, 12, 0, 0, 5)
+
+    monkeypatch.setattr(data_handler, "datetime", FrozenClock)
+    paths = [data_handler.results_path("json") for _ in range(3)]
+    assert len(set(paths)) == 3 and all(os.path.exists(path) for path in paths)
+    assert paths[1].endswith("_000005_2.json")
+    assert all(os.stat(path).st_mode & 0o111 == 0 for path in paths)  # Not executable
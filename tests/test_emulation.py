@@ -0,0 +1,87 @@
+"""
+Tests of the LabOneQ experiments, compiled and run on an emulated session (no instruments needed).
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("laboneq")
+
+from laboneq.contrib.example_helpers.generate_device_setup import generate_device_setup_qubits
+import experiment as experiment_module
+from experiment import Experiment, SINGLE_QUBIT_SIGNALS
+from hardware_config import qubit_signals, readout_lo_frequency
+from config import READOUT_LO_STEP, READOUT_MAX_IF
+
+
+def emulated_experiment(num_qubits=1):
+    """Builds an experiment on an emulated SHFQC, with the experiment signals mapped onto its qubit lines."""
+    device_setup, qubits = generate_device_setup_qubits(
+        number_qubits=num_qubits, shfqc=[{"serial": "DEV12001", "number_of_channels": 6, "readout_multiplex": 6}],
+        include_flux_lines=False, server_host="localhost", setup_name="emulation")
+    signal_map = {}
+    for qubit, logical_qubit in enumerate(qubits):
+        signals = SINGLE_QUBIT_SIGNALS if num_qubits == 1 else qubit_signals(qubit)
+        signal_map.update(zip(signals, (logical_qubit.signals[line] for line in ("measure", "acquire", "drive"))))
+    return Experiment(device_setup=device_setup, device_config=signal_map, emulation=True, num_qubits=num_qubits)
+
+
+@pytest.fixture(autouse=True)
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # LabOneQ writes its logs to the working directory
+
+
+def test_readout_lo_frequency():
+    lo_frequency = readout_lo_frequency([6.3, 6.5, 6.75])
+    assert lo_frequency % READOUT_LO_STEP == 0
+    assert abs(6.3e9 - lo_frequency) <= READOUT_MAX_IF and abs(6.75e9 - lo_frequency) <= READOUT_MAX_IF
+    with pytest.raises(ValueError):
+        readout_lo_frequency([5.5, 7.0])
+
+
+def test_run_batch():
+    points = [("DRAG", 0.6, 6.5, 0.2), ("DRAG", 0.8, 6.5, 0.4), ("Square", 0.7, 6.6, None)]
+    with emulated_experiment() as experiment:
+        results = experiment.run_batch(points, num_shots=16)
+        assert [(result["pulse_type"], result["amplitude"]) for result in results] == \
+               [(pulse_type, amplitude) for pulse_type, amplitude, _, _ in points]
+        assert all(0 <= result["fidelity"] <= 1 and result["iq_data_0"].shape == (16, 2) for result in results)
+
+        # One compiled sweep per pulse shape, reused when the points are measured again
+        experiment.run_batch(points, num_shots=16)
+        assert (experiment._compiled_experiments.misses, experiment._compiled_experiments.hits) == (2, 2)
+
+
+def test_run_adaptive_measures_only_active_points(monkeypatch):
+    # Emulated shots carry no signal, so the first point is given a clearly better fidelity than the others
+    monkeypatch.setattr(experiment_module, "calculate_fidelities",
+                        lambda iq_data_0, iq_data_1, discriminator: np.where(np.arange(len(iq_data_0)), 0.5, 0.95))
+    points = [("Gaussian", amplitude, 6.5, None) for amplitude in (0.6, 0.7, 0.8)]
+    with emulated_experiment() as experiment:
+        acquired, acquire = [], experiment._acquire
+        experiment._acquire = lambda batch, num_shots, rng=None: \
+            acquired.append(len(batch) * num_shots) or acquire(batch, num_shots, rng)
+        results = experiment.run_adaptive(points, max_shots=75, batch_shots=25)
+
+        # The worse points stop after the first round, and the instrument measures only the shots reported
+        assert [result["shots"] for result in results] == [75, 25, 25]
+        assert acquired == [3 * 25, 25, 25]
+        # Rounds measuring the same points reuse their compiled experiment
+        assert (experiment._compiled_experiments.misses, experiment._compiled_experiments.hits) == (2, 1)
+
+
+def test_run_multiplexed():
+    points = [[("DRAG", 0.6, 6.5, 0.3), ("Square", 0.7, 6.7, None)],
+              [("DRAG", 0.8, 6.5, 0.3), ("Square", 0.7, 6.7, None)]]
+    with emulated_experiment(num_qubits=2) as experiment:
+        results = experiment.run_multiplexed(points, num_shots=16)
+        assert [[result["qubit"] for result in point] for point in results] == [[0, 1], [0, 1]]
+        assert experiment._compiled_experiments.misses == 1
+
+
+def test_run_pipelined():
+    points = [("Gaussian", amplitude, 6.5, None) for amplitude in (0.5, 0.6, 0.7, 0.8)]
+    with emulated_experiment() as experiment:
+        results = list(experiment.run_pipelined(points, num_shots=16))
+        assert [result["amplitude"] for result in results] == [amplitude for _, amplitude, _, _ in points]
+        assert experiment._compiled_experiments.misses == len(points)
@@ -0,0 +1,58 @@
+"""
+Tests of the persistent evaluation cache.
+"""
+
+import numpy as np
+from evaluation_cache import EvaluationCache, evaluation_key, cached_result, cache_entry
+from executor import evaluate_points
+from experiment import Experiment
+
+POINT = ("Gaussian", 0.8, 6.5, None)
+
+
+def test_key_covers_the_evaluation_settings():
+    key = evaluation_key(Experiment(), POINT, 200, 1)
+    assert key == evaluation_key(Experiment(), POINT, 200, 1)
+    assert key != evaluation_key(Experiment(discriminator="lda"), POINT, 200, 1)
+    assert key != evaluation_key(Experiment(readout_length=2e-6), POINT, 200, 1)
+    assert key != evaluation_key(Experiment(), POINT, 100, 1)
+    assert key != evaluation_key(Experiment(), POINT, 200, 2)
+    assert key != evaluation_key(Experiment(), ("Gaussian", 0.9, 6.5, None), 200, 1)
+
+
+def test_key_accepts_seed_sequences(tmp_path):
+    seed = np.random.SeedSequence(2 ** 100)
+    key = evaluation_key(Experiment(), POINT, 200, seed)
+    assert key == evaluation_key(Experiment(), POINT, 200, np.random.SeedSequence(2 ** 100))
+    assert key != evaluation_key(Experiment(), POINT, 200, seed.spawn(1)[0])
+    assert key != evaluation_key(Experiment(), POINT, 200, 2 ** 100)
+
+    # A sweep group's spawned seed sequence is evaluated with the cache like an int seed
+    points = [POINT, ("Square", 0.6, 6.6, None)]
+    with EvaluationCache(str(tmp_path / "cache.sqlite")) as cache:
+        for _ in range(2):
+            results = list(evaluate_points(Experiment(), points, seed=np.random.SeedSequence(5).spawn(1)[0],
+                                           num_shots=50, cache=cache))
+        assert (cache.hits, cache.misses) == (2, 2) and results[1]["cached"]
+
+
+def test_cache_round_trip(tmp_path):
+    result = Experiment(seed=0, summary_only=True).run(*POINT)
+    key = evaluation_key(Experiment(), POINT, 200, 0)
+    with EvaluationCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.get(key) is None
+        cache.put(key, cache_entry(result))
+        cached = cached_result(POINT, cache.get(key))
+        assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+    assert cached["cached"] and cached["fidelity"] == result["fidelity"]
+    assert cached.statistics() == result.statistics()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    with EvaluationCache(str(tmp_path / "cache.sqlite"), max_entries=2) as cache:
+        cache.put("a", {"fidelity": 0.1})
+        cache.put("b", {"fidelity": 0.2})
+        cache.get("a")
+        cache.put("c", {"fidelity": 0.3})
+        assert len(cache) == 2 and cache.get("b") is None and cache.get("a") is not None
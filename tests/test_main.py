@@ -0,0 +1,36 @@
+"""
+Tests of the command line argument validation of main.py.
+"""
+
+import pytest
+from main import build_parser, parse_job
+
+AUTOMATIC = ["--mode", "automatic", "--pulse", "all", "--amplitude", "0.7", "--frequency", "6.5"]
+
+
+def test_automatic_job():
+    _, job = parse_job(build_parser(), AUTOMATIC + ["--save", "--format", "csv"])
+    assert (job["amplitude"], job["frequency"], job["save_data"], job["save_format"]) == (0.7, 6.5, True, "csv")
+
+
+def test_sweep_param_is_ignored_in_range_mode(capsys):
+    argv = ["--mode", "manual", "--manual_mode", "range", "--pulse", "all", "--amplitude", "0.5", "0.8",
+            "--frequency", "6.4", "6.6"]
+    _, job = parse_job(build_parser(), argv)
+    assert (job["amplitude"], job["frequency"], job["sweep_param"]) == ((0.5, 0.8), (6.4, 6.6), "amplitude")
+    assert capsys.readouterr().out == ""
+
+    # The documented range mode command still runs, with a note that the flag has no effect
+    assert parse_job(build_parser(), argv + ["--sweep_param", "frequency"])[1]["amplitude"] == (0.5, 0.8)
+    assert "--sweep_param is ignored" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("argv", [
+    AUTOMATIC + ["--save", "--format", "bin"],  # The best parameters have no shots to store
+    AUTOMATIC + ["--amplitude", "0.5", "0.9"],
+    ["--mode", "manual", "--manual_mode", "single", "--pulse", "Square", "--amplitude", "0.5",
+     "--frequency", "6.5", "--summary_only", "--save", "--format", "bin"],
+])
+def test_invalid_arguments_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        parse_job(build_parser(), argv)
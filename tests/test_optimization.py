@@ -0,0 +1,68 @@
+"""
+Tests of the readout parameter optimizations, in simulation mode.
+"""
+
+import pytest
+from optimization import basic_optimization, multiplexed_optimization, grid_points, OPTIMIZERS
+from config import NUM_MEASUREMENTS
+
+PULSE_TYPES = ["Gaussian", "Square", "DRAG"]
+AMPLITUDE_RANGE, FREQUENCY_RANGE = (0.6, 1.0), (6.2, 6.8)
+
+
+def within(value, bounds):
+    return bounds[0] <= value <= bounds[1]
+
+
+def test_grid_points():
+    points = grid_points(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, steps=3)
+    assert len(points) == 2 * 3 ** 2 + 3 ** 3
+    assert all((beta is None) == (pulse_type != "DRAG") for pulse_type, _, _, beta in points)
+
+
+def test_grid_search_does_not_depend_on_the_workers():
+    results = [basic_optimization(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, 3, seed=1, workers=workers)
+               for workers in (1, 2)]
+    assert results[0] == results[1]
+    assert results[0]["evaluations"] == 45 and results[0]["shots"] == 45 * NUM_MEASUREMENTS
+
+
+@pytest.mark.parametrize("method", ["grid", "nelder_mead"])
+def test_shot_count(method):
+    result = basic_optimization(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, 3, seed=1, method=method,
+                                max_evaluations=10, num_shots=50)
+    assert result["shots"] == result["evaluations"] * 50
+
+    result = basic_optimization(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, 3, seed=1, adaptive_shots=True,
+                                num_shots=50)
+    assert result["shots"] <= result["evaluations"] * 50
+
+
+@pytest.mark.parametrize("method", list(OPTIMIZERS))
+def test_adaptive_optimizers(method):
+    result = basic_optimization(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, seed=1, method=method,
+                                max_evaluations=20)
+    assert result["pulse_type"] in PULSE_TYPES and result["evaluations"] <= 20 * len(PULSE_TYPES)
+    assert within(result["amplitude"], AMPLITUDE_RANGE) and within(result["frequency"], FREQUENCY_RANGE)
+    assert result["fidelity"] > 0.9
+
+
+def test_adaptive_shots_use_fewer_shots():
+    result = basic_optimization(PULSE_TYPES, AMPLITUDE_RANGE, FREQUENCY_RANGE, 3, seed=1, adaptive_shots=True)
+    assert result["evaluations"] == 45 and result["shots"] < 45 * NUM_MEASUREMENTS
+    assert result["fidelity"] > 0.9
+
+
+def test_progress_callback():
+    updates = []
+    basic_optimization(["Square"], AMPLITUDE_RANGE, FREQUENCY_RANGE, 3, seed=1,
+                       progress=lambda count, total: updates.append((count, total)))
+    assert sum(count for count, _ in updates) == 9 and {total for _, total in updates} == {9}
+
+
+def test_multiplexed_optimization():
+    qubit_ranges = [(AMPLITUDE_RANGE, FREQUENCY_RANGE), ((0.8, 1.2), (6.6, 7.0))]
+    results = multiplexed_optimization(["Gaussian", "Square"], qubit_ranges, steps=3, seed=1)
+    assert [result["qubit"] for result in results] == [0, 1]
+    for result, (amplitude_range, frequency_range) in zip(results, qubit_ranges):
+        assert within(result["amplitude"], amplitude_range) and within(result["frequency"], frequency_range)
@@ -0,0 +1,95 @@
+"""
+Tests of the compile/execute/analyze pipeline, run on the mock hardware backend.
+"""
+
+import threading
+import time
+from experiment import Experiment
+from pipeline import ExperimentPipeline, MockHardwareBackend, split_jobs
+
+NUM_JOBS = 8
+
+
+class RecordingBackend(MockHardwareBackend):
+    """Mock hardware backend recording when every job is compiled and executed."""
+
+    def __init__(self, experiment, compile_latency, execute_latency):
+        super().__init__(experiment, compile_latency, execute_latency)
+        self.events, self._lock = [], threading.Lock()
+
+    def record(self, stage, job, start):
+        with self._lock:
+            self.events.append((stage, job, start, time.perf_counter()))
+
+    def compile(self, points, num_shots):
+        start = time.perf_counter()
+        compiled = super().compile(points, num_shots)
+        self.record("compile", points[0][1], start)
+        return compiled
+
+    def execute(self, compiled, num_shots):
+        start = time.perf_counter()
+        iq_data = super().execute(compiled, num_shots)
+        self.record("execute", compiled[0][1], start)
+        return iq_data
+
+    def intervals(self, stage):
+        return {job: (start, end) for name, job, start, end in self.events if name == stage}
+
+
+def job_points():
+    return [("Gaussian", 0.5 + 0.05 * job, 6.5, None) for job in range(NUM_JOBS)]
+
+
+def overlaps(first, second):
+    return first[0] < second[1] and second[0] < first[1]
+
+
+def test_split_jobs():
+    points = [("Gaussian", 0.5, 6.5, None)] * 3 + [("Square", 0.5, 6.5, None)] * 2
+    assert [len(job) for job in split_jobs(points, job_size=2)] == [2, 1, 2]
+
+
+def test_results_stay_in_point_order():
+    experiment = Experiment(seed=0)
+    backend = MockHardwareBackend(experiment, compile_latency=0.001, execute_latency=0.003)
+    points = job_points() + [("Square", 0.8, 6.5, None), ("DRAG", 0.7, 6.6, 0.3)]
+    results = list(experiment.run_pipelined(points, num_shots=50, backend=backend, job_size=3))
+    assert [(result["pulse_type"], result["amplitude"]) for result in results] == \
+           [(pulse_type, amplitude) for pulse_type, amplitude, _, _ in points]
+
+
+def test_stages_overlap():
+    experiment = Experiment(seed=0)
+    backend = RecordingBackend(experiment, compile_latency=0.02, execute_latency=0.02)
+    analyzed = []
+
+    def analyze(job, iq_data_0, iq_data_1):
+        start = time.perf_counter()
+        results = experiment._analyze(job, iq_data_0, iq_data_1)
+        time.sleep(0.02)
+        analyzed.append((job[0][1], (start, time.perf_counter())))
+        return results
+
+    results = list(ExperimentPipeline(backend, analyze).run(job_points(), num_shots=50))
+
+    assert len(results) == NUM_JOBS
+    compiled, executed, analyzed = backend.intervals("compile"), backend.intervals("execute"), dict(analyzed)
+    jobs = [amplitude for _, amplitude, _, _ in job_points()]
+    # While a job executes, the next one compiles and the previous one is analyzed
+    assert any(overlaps(executed[job], compiled[next_job]) for job, next_job in zip(jobs, jobs[1:]))
+    assert any(overlaps(executed[next_job], analyzed[job]) for job, next_job in zip(jobs, jobs[1:]))
+
+
+def test_bounded_queues_apply_backpressure():
+    experiment = Experiment(seed=0)
+    backend = RecordingBackend(experiment, compile_latency=0.0, execute_latency=0.02)
+    queue_size = 1
+    list(ExperimentPipeline(backend, experiment._analyze, queue_size).run(job_points(), num_shots=50))
+
+    # Compilation is instant, but may only run a bounded number of jobs ahead of execution: the queued
+    # jobs plus the one waiting to be queued
+    compiled, executed = backend.intervals("compile"), backend.intervals("execute")
+    first_end = executed[job_points()[0][1]][1]
+    compiled_early = sum(end < first_end for _, end in compiled.values())
+    assert compiled_early <= queue_size + 2 < NUM_JOBS
@@ -0,0 +1,22 @@
+"""
+Tests of the headless IQ plots.
+"""
+
+import os
+from experiment import Experiment
+from plotting import plot_iq_results, plot_sweep_page
+
+
+def test_plot_iq_results_writes_png(tmp_path):
+    results = [Experiment(seed=0).run(pulse_type, 0.8, 6.5) for pulse_type in ("Gaussian", "Square")]
+    output = str(tmp_path / "plot")
+    assert plot_iq_results(results, "single", "amplitude", output) == f"{output}.png"
+    assert os.path.exists(f"{output}.png")
+
+
+def test_nothing_to_plot(tmp_path, capsys):
+    output = str(tmp_path / "plot")
+    assert plot_iq_results([None, None], "single", "amplitude", output) is None
+    assert plot_sweep_page([None] * 3, 0, ["amplitude"], 3, output) is None
+    assert not os.listdir(tmp_path)
+    assert "No results to plot." in capsys.readouterr().out
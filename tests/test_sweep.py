@@ -0,0 +1,75 @@
+"""
+Tests of the parameter sweeps and the range mode sweep of main.py.
+"""
+
+import pytest
+import main
+from experiment import Experiment
+from main import run_range_sweep
+from sweep import Sweep, run_sweep
+
+
+def sweep_points(sweep):
+    return [point for _, point in sweep]
+
+
+def test_product_sweep():
+    sweep = Sweep(pulse_type=["Gaussian", "DRAG"], amplitude=[0.5, 0.6], frequency=[6.4, 6.5, 6.6], beta=[0.1, 0.2])
+    points = sweep_points(sweep)
+    assert len(points) == len(sweep) == (1 + 2) * 2 * 3
+    assert sweep.swept == ["pulse_type", "amplitude", "frequency", "beta"] and sweep.columns == 2
+    # Beta only multiplies the DRAG points
+    assert [point for point in points if point[0] == "Gaussian"][:2] == \
+           [("Gaussian", 0.5, 6.4, None), ("Gaussian", 0.5, 6.5, None)]
+    assert points[-2:] == [("DRAG", 0.6, 6.6, 0.1), ("DRAG", 0.6, 6.6, 0.2)]
+
+
+def test_zipped_sweep():
+    sweep = Sweep(zipped=True, pulse_type=["Square", "DRAG"], amplitude=[0.5, 0.6, 0.7], frequency=[6.5],
+                  beta=[0.1, 0.2, 0.3])
+    assert len(sweep) == 6 and sweep.columns == 3
+    assert sweep_points(sweep) == [("Square", 0.5, 6.5, None), ("Square", 0.6, 6.5, None),
+                                   ("Square", 0.7, 6.5, None), ("DRAG", 0.5, 6.5, 0.1),
+                                   ("DRAG", 0.6, 6.5, 0.2), ("DRAG", 0.7, 6.5, 0.3)]
+    with pytest.raises(ValueError):
+        Sweep(zipped=True, pulse_type=["Square"], amplitude=[0.5, 0.6], frequency=[6.4, 6.5, 6.6])
+
+
+def test_readout_length_is_outermost():
+    sweep = Sweep(pulse_type=["Square"], amplitude=[0.5, 0.6], frequency=[6.5], length=[1e-6, 2e-6])
+    assert [length for length, _ in sweep] == [1e-6, 1e-6, 2e-6, 2e-6]
+    with pytest.raises(ValueError):
+        Sweep(pulse_type=["Square"], amplitude=[0.5], frequency=[6.5], length=[0])
+
+
+def test_run_sweep_chunks_in_order():
+    sweep = Sweep(pulse_type=["Gaussian", "DRAG"], amplitude=[0.5, 0.6, 0.7], frequency=[6.5], beta=[0.1, 0.2],
+                  length=[1e-6, 2e-6])
+    experiment = Experiment(seed=0)
+    chunks = list(run_sweep(experiment, sweep, seed=0, num_shots=50, chunk_size=4))
+    assert all(len(chunk) <= 4 for chunk in chunks)
+
+    results = [result for chunk in chunks for result in chunk]
+    assert [(result["length"], (result["pulse_type"], result["amplitude"], result["frequency"], result.get("beta")))
+            for result in results] == list(sweep)
+    assert experiment.readout_length == Experiment(seed=0).readout_length  # Restored after the sweep
+
+
+def test_run_sweep_independent_of_workers():
+    sweep = Sweep(pulse_type=["Gaussian", "Square"], amplitude=[0.5, 0.6, 0.7], frequency=[6.4, 6.6])
+    fidelities = [[result["fidelity"] for chunk in run_sweep(Experiment(seed=0), sweep, workers, seed=3,
+                                                             num_shots=50, chunk_size=5) for result in chunk]
+                  for workers in (1, 2)]
+    assert fidelities[0] == fidelities[1]
+
+
+@pytest.mark.parametrize("plot_output, pages", [(None, 1), ("iq", 3)])
+def test_range_sweep_shows_only_first_page(monkeypatch, plot_output, pages):
+    plotted = []
+    monkeypatch.setattr(main, "plot_sweep_page", lambda results, page, *args: plotted.append((page, len(results))))
+    # 6 x 16 points make 3 pages of 32 tiles
+    run_range_sweep(Experiment(seed=0), ["Square"], (0.5, 0.8), (6.4, 6.6), None, None,
+                    {"amplitude": 6, "frequency": 16}, "product", False, "json", 1, 0, plot_output, "png", 1000,
+                    show_plot=True)
+    assert [page for page, _ in plotted] == list(range(pages))
+    assert all(size == 32 for _, size in plotted)
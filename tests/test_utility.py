@@ -0,0 +1,77 @@
+"""
+Tests of the IQ simulation, state discriminators and fidelity statistics.
+"""
+
+import numpy as np
+import pytest
+from utility import (make_rng, simulate_iq_batch, simulate_multiplexed_batch, calculate_fidelities,
+                     calculate_qubit_fidelities, calculate_fidelity, fidelity_interval, LRUCache, DISCRIMINATORS)
+
+AMPLITUDES, FREQUENCIES = np.linspace(0.5, 1.5, 6), np.linspace(6.4, 6.6, 6)
+
+
+def simulated_states(num_shots=200, seed=0):
+    rng = make_rng(seed)
+    return (simulate_iq_batch("0", AMPLITUDES, FREQUENCIES, num_shots, rng=rng),
+            simulate_iq_batch("1", AMPLITUDES, FREQUENCIES, num_shots, rng=rng))
+
+
+def test_simulation_is_reproducible():
+    np.testing.assert_array_equal(simulated_states(seed=3)[1], simulated_states(seed=3)[1])
+    assert simulated_states()[0].shape == (len(AMPLITUDES), 200, 2)
+
+
+@pytest.mark.parametrize("discriminator", list(DISCRIMINATORS))
+def test_separated_states_are_discriminated(discriminator):
+    rng = np.random.default_rng(0)
+    iq_data_0 = rng.normal(0.0, 0.1, (3, 100, 2))
+    iq_data_1 = rng.normal(5.0, 0.1, (3, 100, 2))
+    np.testing.assert_array_equal(calculate_fidelities(iq_data_0, iq_data_1, discriminator), 1.0)
+
+
+@pytest.mark.parametrize("discriminator", list(DISCRIMINATORS))
+def test_batched_fidelities_match_single_points(discriminator):
+    iq_data_0, iq_data_1 = simulated_states()
+    fidelities = calculate_fidelities(iq_data_0, iq_data_1, discriminator)
+    assert np.all((fidelities >= 0) & (fidelities <= 1))
+    np.testing.assert_allclose(fidelities, [calculate_fidelity(data_0, data_1, discriminator)
+                                            for data_0, data_1 in zip(iq_data_0, iq_data_1)])
+
+
+def test_optimal_threshold_is_at_least_as_good_as_nearest_mean():
+    # The nearest mean assignment is one of the thresholds the linear threshold discriminator tries
+    iq_data_0, iq_data_1 = simulated_states()
+    assert np.all(calculate_fidelities(iq_data_0, iq_data_1, "linear_threshold")
+                  >= calculate_fidelities(iq_data_0, iq_data_1, "nearest_mean"))
+
+
+def test_unknown_discriminator():
+    with pytest.raises(ValueError):
+        calculate_fidelities(*simulated_states(), discriminator="unknown")
+
+
+def test_qubit_fidelities_discriminate_every_qubit_on_its_own():
+    rng = make_rng(0)
+    amplitudes, frequencies = np.stack([AMPLITUDES, AMPLITUDES[::-1]], 1), np.stack([FREQUENCIES] * 2, 1)
+    iq_data_0 = simulate_multiplexed_batch("0", amplitudes, frequencies, 100, crosstalk=0.05, rng=rng)
+    iq_data_1 = simulate_multiplexed_batch("1", amplitudes, frequencies, 100, crosstalk=0.05, rng=rng)
+    fidelities = calculate_qubit_fidelities(iq_data_0, iq_data_1)
+    assert fidelities.shape == (len(AMPLITUDES), 2)
+    np.testing.assert_allclose(fidelities[:, 1], calculate_fidelities(iq_data_0[:, 1], iq_data_1[:, 1]))
+
+
+def test_fidelity_interval():
+    lower, upper = fidelity_interval(np.array([0.6, 0.9]), 100)
+    assert np.all((lower < [0.6, 0.9]) & ([0.6, 0.9] < upper))
+    narrower_lower, narrower_upper = fidelity_interval(np.array([0.6, 0.9]), 1000)
+    assert np.all(narrower_upper - narrower_lower < upper - lower)
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache and "a" in cache and len(cache) == 2
+    assert (cache.hits, cache.get("b"), cache.misses) == (1, None, 1)
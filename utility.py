@@ -2,24 +2,226 @@
 This module contains utility functions for simulations and calculations.
 """
 
+from collections import OrderedDict
+from statistics import NormalDist
 import numpy as np
 
 
-def simulate_iq_response(state, amplitude, frequency, noise_level=0.5):
+def make_rng(seed=None):
+    """Create a numpy random Generator, reusing one if it is passed in."""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def simulate_iq_response(state, amplitude, frequency, noise_level=0.5, rng=None):
     """Simulate IQ response for a qubit state with noise and frequency shift."""
     response = np.array([1.0, 0.0]) if state == "0" else np.array([-1.0, 0.0])
     response *= amplitude
     response += np.array([np.cos(2 * np.pi * frequency), np.sin(2 * np.pi * frequency)]) * 0.1  # Frequency shift
-    response += np.random.normal(0, noise_level, response.shape)
+    response += make_rng(rng).normal(0, noise_level, response.shape)
     return response
 
 
-def calculate_fidelity(iq_data_0, iq_data_1):
+def simulate_iq_batch(state, amplitudes, frequencies, num_shots, noise_level=0.5, rng=None):
+    """
+    Simulate IQ responses for a batch of parameter points in one vectorized pass.
+
+    Uses the same response model as simulate_iq_response (pulse shape and beta do not enter it),
+    and returns an array of shape (points, shots, 2).
+    """
+    amplitudes = np.asarray(amplitudes, dtype=float).reshape(-1)
+    frequencies = np.asarray(frequencies, dtype=float).reshape(-1)
+    if amplitudes.shape != frequencies.shape:
+        raise ValueError("Amplitudes and frequencies must contain the same number of points.")
+
+    sign = 1.0 if state == "0" else -1.0
+    phase = 2 * np.pi * frequencies
+    centers = np.empty((amplitudes.size, 1, 2))
+    centers[:, 0, 0] = sign * amplitudes + 0.1 * np.cos(phase)  # Frequency shift
+    centers[:, 0, 1] = 0.1 * np.sin(phase)
+
+    return centers + make_rng(rng).normal(0, noise_level, (amplitudes.size, num_shots, 2))
+
+
+def simulate_multiplexed_batch(state, amplitudes, frequencies, num_shots, crosstalk=0.0, noise_level=0.5, rng=None):
+    """
+    Simulate the simultaneous readout of N qubits on one feedline for a batch of parameter points.
+
+    Amplitudes and frequencies have shape (points, qubits), every qubit is prepared in state. Each qubit
+    responds as in simulate_iq_batch, and its signal also picks up a crosstalk fraction of every other
+    qubit's response. The detuned tones beat during integration, so the leaked signal has a random phase
+    in every shot and acts as additional, amplitude-dependent noise. Returns (points, qubits, shots, 2).
+    """
+    amplitudes = np.atleast_2d(np.asarray(amplitudes, dtype=float))
+    frequencies = np.atleast_2d(np.asarray(frequencies, dtype=float))
+    if amplitudes.shape != frequencies.shape:
+        raise ValueError("Amplitudes and frequencies must have the same (points, qubits) shape.")
+
+    rng = make_rng(rng)
+    sign = 1.0 if state == "0" else -1.0
+    responses = sign * amplitudes + 0.1 * np.exp(2j * np.pi * frequencies)  # As complex I + jQ
+    signal = np.stack([responses.real, responses.imag], axis=-1)[:, :, None, :]
+    signal = signal + rng.normal(0, noise_level, amplitudes.shape + (num_shots, 2))
+
+    num_qubits = amplitudes.shape[1]
+    if crosstalk and num_qubits > 1:
+        # leak[p, q, k, s] is the response of qubit k picked up by the readout of qubit q in shot s
+        phases = rng.uniform(0, 2 * np.pi, (amplitudes.shape[0], num_qubits, num_qubits, num_shots))
+        leak = crosstalk * responses[:, None, :, None] * np.exp(1j * phases)
+        leak[:, np.arange(num_qubits), np.arange(num_qubits)] = 0
+        leak = leak.sum(axis=2)
+        signal += np.stack([leak.real, leak.imag], axis=-1)
+    return signal
+
+
+def _nearest_mean_correct(iq_data_0, iq_data_1, mean_0, mean_1):
+    """Count correctly assigned shots when each shot is assigned to the closest state mean."""
+    def closer_to_own(data, own_mean, other_mean):
+        own = np.sum((data - own_mean) ** 2, axis=-1)
+        other = np.sum((data - other_mean) ** 2, axis=-1)
+        return np.count_nonzero(own < other, axis=-1)
+
+    return closer_to_own(iq_data_0, mean_0, mean_1), closer_to_own(iq_data_1, mean_1, mean_0)
+
+
+def _linear_threshold_correct(iq_data_0, iq_data_1, mean_0, mean_1):
+    """Count correctly assigned shots for the best threshold along the state-separation axis."""
+    axis = (mean_1 - mean_0)[:, 0]
+    proj_0 = np.einsum("psi,pi->ps", iq_data_0, axis)
+    proj_1 = np.einsum("psi,pi->ps", iq_data_1, axis)
+    num_points, num_0, num_1 = proj_0.shape[0], proj_0.shape[1], proj_1.shape[1]
+
+    # Sort the projections of both states together, a threshold after the first k shots
+    # assigns those shots to |0> and all the others to |1>
+    projections = np.concatenate([proj_0, proj_1], axis=-1)
+    order = np.argsort(projections, axis=-1, kind="stable")
+    sorted_projections = np.take_along_axis(projections, order, axis=-1)
+    below_0 = np.concatenate([np.zeros((num_points, 1), dtype=int), np.cumsum(order < num_0, axis=-1)], axis=-1)
+    below_1 = np.arange(num_0 + num_1 + 1) - below_0
+
+    # A threshold cannot separate two shots with identical projections
+    separable = np.ones_like(below_0, dtype=bool)
+    separable[:, 1:-1] = sorted_projections[:, :-1] < sorted_projections[:, 1:]
+    correct = np.where(separable, below_0 + num_1 - below_1, -1)
+
+    best = np.argmax(correct, axis=-1)[:, None]
+    return np.take_along_axis(below_0, best, -1)[:, 0], num_1 - np.take_along_axis(below_1, best, -1)[:, 0]
+
+
+def _lda_correct(iq_data_0, iq_data_1, mean_0, mean_1):
+    """Count correctly assigned shots for a Gaussian classifier with a shared (pooled) covariance."""
+    centered = np.concatenate([iq_data_0 - mean_0, iq_data_1 - mean_1], axis=1)
+    covariance = np.einsum("psi,psj->pij", centered, centered) / max(centered.shape[1] - 2, 1)
+    covariance += 1e-12 * np.eye(2)  # Keeps degenerate (noise-free) data invertible
+
+    weights = np.linalg.solve(covariance, (mean_1 - mean_0)[:, 0, :, None])[..., 0]
+    offset = np.einsum("pi,pi->p", weights, (mean_0 + mean_1)[:, 0] / 2)[:, None]
+
+    score_0 = np.einsum("psi,pi->ps", iq_data_0, weights) - offset
+    score_1 = np.einsum("psi,pi->ps", iq_data_1, weights) - offset
+    return np.count_nonzero(score_0 < 0, axis=-1), np.count_nonzero(score_1 > 0, axis=-1)
+
+
+# Available state discriminators, each returning the number of correctly assigned |0> and |1> shots per point
+DISCRIMINATORS = {
+    "nearest_mean": _nearest_mean_correct,
+    "linear_threshold": _linear_threshold_correct,
+    "lda": _lda_correct,
+}
+
+
+def calculate_fidelities(iq_data_0, iq_data_1, discriminator="nearest_mean"):
+    """
+    Compute the readout fidelity of many parameter points in one vectorized call.
+
+    The IQ data of each state is stacked with shape (points, shots, 2). The discriminator is either a
+    name from DISCRIMINATORS or a callable with the same signature. Returns an array of shape (points,).
+    """
+    iq_data_0, iq_data_1 = np.asarray(iq_data_0, dtype=float), np.asarray(iq_data_1, dtype=float)
+    if iq_data_0.ndim != 3 or iq_data_1.ndim != 3 or iq_data_0.shape[0] != iq_data_1.shape[0]:
+        raise ValueError("IQ data must be stacked as (points, shots, 2) arrays with the same number of points.")
+
+    if callable(discriminator):
+        count_correct = discriminator
+    elif discriminator in DISCRIMINATORS:
+        count_correct = DISCRIMINATORS[discriminator]
+    else:
+        raise ValueError(f"Unknown discriminator '{discriminator}'. Must be one of {list(DISCRIMINATORS)}")
+
+    mean_0 = np.mean(iq_data_0, axis=1, keepdims=True)
+    mean_1 = np.mean(iq_data_1, axis=1, keepdims=True)
+    correct_0, correct_1 = count_correct(iq_data_0, iq_data_1, mean_0, mean_1)
+
+    return (correct_0 + correct_1) / (iq_data_0.shape[1] + iq_data_1.shape[1])
+
+
+def calculate_qubit_fidelities(iq_data_0, iq_data_1, discriminator="nearest_mean"):
+    """
+    Compute the readout fidelity of every qubit at many parameter points in one vectorized call.
+
+    The IQ data of each state is stacked with shape (points, qubits, shots, 2), and every qubit is
+    discriminated on its own. Returns an array of shape (points, qubits).
+    """
+    iq_data_0, iq_data_1 = np.asarray(iq_data_0, dtype=float), np.asarray(iq_data_1, dtype=float)
+    if iq_data_0.ndim != 4 or iq_data_0.shape[:2] != iq_data_1.shape[:2]:
+        raise ValueError("IQ data must be stacked as (points, qubits, shots, 2) arrays with the same shape.")
+
+    num_points, num_qubits = iq_data_0.shape[:2]
+    fidelities = calculate_fidelities(iq_data_0.reshape(num_points * num_qubits, -1, 2),
+                                      iq_data_1.reshape(num_points * num_qubits, -1, 2), discriminator)
+    return fidelities.reshape(num_points, num_qubits)
+
+
+def calculate_fidelity(iq_data_0, iq_data_1, discriminator="nearest_mean"):
     """Compute the readout fidelity."""
-    mean_0 = np.mean(iq_data_0, axis=0)
-    mean_1 = np.mean(iq_data_1, axis=0)
+    return float(calculate_fidelities(np.asarray(iq_data_0)[None], np.asarray(iq_data_1)[None], discriminator)[0])
+
+
+def fidelity_interval(fidelity, num_shots, confidence=0.95):
+    """
+    Wilson score confidence interval of fidelities estimated from num_shots shots per state.
+
+    Works element-wise on arrays and returns the (lower, upper) bounds.
+    """
+    fidelity = np.asarray(fidelity, dtype=float)
+    n = 2 * np.asarray(num_shots, dtype=float)  # Both states contribute to the estimate
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    center = (fidelity + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+    half_width = z / (1 + z ** 2 / n) * np.sqrt(fidelity * (1 - fidelity) / n + z ** 2 / (4 * n ** 2))
+    return center - half_width, center + half_width
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry once it is full."""
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the cached value for key (marking it as recently used), or default if it is missing."""
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
 
-    correct_0 = sum(np.linalg.norm(p - mean_0) < np.linalg.norm(p - mean_1) for p in iq_data_0)
-    correct_1 = sum(np.linalg.norm(p - mean_1) < np.linalg.norm(p - mean_0) for p in iq_data_1)
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if the cache is full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
 
-    return (correct_0 + correct_1) / (len(iq_data_0) + len(iq_data_1))
+    def clear(self):
+        """Remove all cached entries."""
+        self._data.clear()